@@ -0,0 +1,31 @@
+"""Loans autoincrement on SQLite
+
+Revision ID: 7c2e1a9d4b63
+Revises: 5f4eedfb04e0
+Create Date: 2025-03-31 09:12:44.180265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e1a9d4b63'
+down_revision: Union[str, None] = '5f4eedfb04e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # without AUTOINCREMENT SQLite hands out the ids of archived loans again, Postgres sequences never do.
+    # SQLite cannot change it in place, the batch copies the table
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('loans', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('loans', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
@@ -0,0 +1,46 @@
+"""Index audit: index loans.book_id, drop dead indexes
+
+Revision ID: ddc3af1376fe
+Revises: afb2c70c709b
+Create Date: 2025-03-29 15:27:14.082935
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ddc3af1376fe'
+down_revision: Union[str, None] = 'afb2c70c709b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the primary keys are indexed already, and nothing looks users up by password hash
+DEAD_INDEXES = [
+    ('ix_users_password', 'users', ['password']),
+    ('ix_users_id', 'users', ['id']),
+    ('ix_authors_id', 'authors', ['id']),
+    ('ix_books_id', 'books', ['id']),
+    ('ix_loans_id', 'loans', ['id']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY doesn't lock the tables against writes on Postgres, but can't run in a transaction.
+    # A concurrent build that fails leaves an invalid index behind, if_not_exists / if_exists
+    # let the migration be run again after dropping it.
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_loans_book_id'), 'loans', ['book_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        for name, table, _ in DEAD_INDEXES:
+            op.drop_index(op.f(name), table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(DEAD_INDEXES):
+            op.create_index(op.f(name), table, columns, unique=False, postgresql_concurrently=True,
+                            if_not_exists=True)
+        op.drop_index(op.f('ix_loans_book_id'), table_name='loans', postgresql_concurrently=True, if_exists=True)
@@ -3,14 +3,15 @@ from datetime import date
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, joinedload
 
-from app.models import Author, get_db
+from app import queries
+from app.models import Author, book_authors, get_db, get_read_db
+from app.streaming import STREAM_BATCH_SIZE, json_array
 from app.user.auth import check_admin
 
 router = APIRouter()
-logging.basicConfig(filename='app.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 
 
 class AuthorCreate(BaseModel):
@@ -29,34 +30,90 @@ class AuthorResponse(AuthorCreate):
         }
 
 
+class AuthorBookResponse(BaseModel):
+    id: int
+    title: str
+    publication: date | None = None
+    style: str | None = None
+    copies: int | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class AuthorListResponse(AuthorResponse):
+    book_count: int = 0
+
+
+class AuthorDetailResponse(AuthorListResponse):
+    books: list[AuthorBookResponse] | None = None
+
+
+class AuthorsDelete(BaseModel):
+    ids: list[int]
+
+
+class AuthorsDeleteResult(BaseModel):
+    deleted: list[int]
+    not_found: list[int]
+
+
+def author_response(author: Author, book_count: int, books: list | None = None) -> AuthorDetailResponse:
+    data = dict(id=author.id, name=author.name, bio=author.bio, bday=author.bday, book_count=book_count)
+    if books is not None:
+        data["books"] = [AuthorBookResponse.model_validate(book) for book in books]
+    return AuthorDetailResponse(**data)
+
+
 # Create author
 @router.post("/author/create", response_model=AuthorResponse, dependencies=[Depends(check_admin)])
 def create_author(author: AuthorCreate, db: Session = Depends(get_db)):
     try:
-        db_author = Author(name=author.name, bio=author.bio, bday=author.bday)
-        db.add(db_author)
+        db_author = queries.insert_returning(db, Author, name=author.name, bio=author.bio, bday=author.bday)
+        response = AuthorResponse.model_validate(db_author)
         db.commit()
-        db.refresh(db_author)
-        logging.info(f"Created new author with ID: {db_author.id}")
-        return db_author
+        logging.info(f"Created new author with ID: {response.id}")
+        return response
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-# Get all authors
-@router.get("/author/get", response_model=list[AuthorResponse])
-def get_all_authors(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    authors = db.query(Author).offset(skip).limit(limit).all()
-    return authors
-
-
-# Get author by id
-@router.get("/author/get/{author_id}", response_model=AuthorResponse)
-def get_author_by_id(author_id: int, db: Session = Depends(get_db)):
-    author = db.query(Author).filter(Author.id == author_id).first()
-    if author is None:
+# Get all authors with the number of their books (one aggregated query over book_authors),
+# ?stream=true sends the page as it is read from the database
+@router.get("/author/get", response_model=list[AuthorListResponse])
+def get_all_authors(skip: int = 0, limit: int = 10, stream: bool = False, db: Session = Depends(get_read_db)):
+    book_count = func.count(book_authors.c.book_id)
+    query = (db.query(Author, book_count)
+             .outerjoin(book_authors, book_authors.c.author_id == Author.id)
+             .group_by(Author.id)
+             .order_by(Author.id)
+             .offset(skip).limit(limit))
+    if not stream:
+        return [author_response(author, count) for author, count in query.all()]
+
+    result = db.execute(query.statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+    return json_array([AuthorListResponse(id=author.id, name=author.name, bio=author.bio, bday=author.bday,
+                                          book_count=count) for author, count in rows]
+                      for rows in result.partitions())
+
+
+# Get author by id, ?include=books loads the bibliography in the same query
+@router.get("/author/get/{author_id}", response_model=AuthorDetailResponse, response_model_exclude_unset=True)
+def get_author_by_id(author_id: int, include: str | None = None, db: Session = Depends(get_read_db)):
+    if include == "books":
+        author = db.query(Author).options(joinedload(Author.books)).filter(Author.id == author_id).first()
+        if author is None:
+            raise HTTPException(status_code=404, detail="Author not found")
+        return author_response(author, len(author.books), author.books)
+
+    row = (db.query(Author, func.count(book_authors.c.book_id))
+           .outerjoin(book_authors, book_authors.c.author_id == Author.id)
+           .filter(Author.id == author_id)
+           .group_by(Author.id)
+           .first())
+    if row is None:
         raise HTTPException(status_code=404, detail="Author not found")
-    return author
+    return author_response(*row)
 
 
 # Update author by id
@@ -75,14 +132,28 @@ def update_author_by_id(author_id: int, author: AuthorCreate, db: Session = Depe
     return db_author
 
 
-# Delete author by id
+def delete_authors(db: Session, author_ids: list[int]) -> list[int]:
+    """Delete authors and their book links with set-based statements, return the ids that existed."""
+    ids = set(db.scalars(select(Author.id).where(Author.id.in_(author_ids))))
+    if ids:
+        db.execute(delete(book_authors).where(book_authors.c.author_id.in_(ids)))
+        db.execute(delete(Author).where(Author.id.in_(ids)))
+    return sorted(ids)
+
+
+# Delete author by id, the books stay in the catalog
 @router.delete("/author/delete/{author_id}", response_model=dict, dependencies=[Depends(check_admin)])
 def delete_author_by_id(author_id: int, db: Session = Depends(get_db)):
-    db_author = db.query(Author).filter(Author.id == author_id).first()
-    if db_author is None:
+    if not delete_authors(db, [author_id]):
         raise HTTPException(status_code=404, detail="Author not found")
+    db.commit()
+    logging.info(f"Deleted author with ID: {author_id}")
+    return {"detail": "Delete author", "ID": str(author_id)}
+
 
-    db.delete(db_author)
+@router.post("/admin/authors/delete", response_model=AuthorsDeleteResult, dependencies=[Depends(check_admin)])
+def delete_authors_by_ids(authors: AuthorsDelete, db: Session = Depends(get_db)):
+    deleted = delete_authors(db, authors.ids)
     db.commit()
-    logging.info(f"Deleted author with ID: {db_author.id}")
-    return {"detail": "Delete author", "ID": str(db_author.id)}
+    logging.info(f"Deleted authors: {deleted}")
+    return AuthorsDeleteResult(deleted=deleted, not_found=sorted(set(authors.ids) - set(deleted)))
@@ -0,0 +1,85 @@
+# loan history, returned loans are moved here from the loans table
+import logging
+from datetime import date
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy import Date, delete, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from app.models import Loan, LoanArchive, get_read_db
+from app.user.auth import check_admin
+
+router = APIRouter(dependencies=[Depends(check_admin)])
+
+
+class ArchivedLoanResponse(BaseModel):
+    id: int
+    user_id: int
+    book_id: int
+    loan_date: date
+    return_date: date
+    returned_at: date
+
+    class Config:
+        from_attributes = True
+
+
+def archive_loan(db: Session, loan: Loan, returned_at: date = None):
+    """Move a loan to the archive in the current transaction."""
+    db.execute(insert(LoanArchive).values(id=loan.id, returned_at=returned_at or date.today(), user_id=loan.user_id,
+                                          book_id=loan.book_id, loan_date=loan.loan_date,
+                                          return_date=loan.return_date))
+    db.delete(loan)
+
+
+def archive_loans(db: Session, *where, returned_at: date = None) -> set[int]:
+    """Move the matching loans to the archive with two statements, return the ids of their readers."""
+    user_ids = set(db.scalars(select(Loan.user_id).where(*where).distinct()))
+    if user_ids:
+        db.execute(insert(LoanArchive).from_select(
+            ["id", "returned_at", "user_id", "book_id", "loan_date", "return_date"],
+            select(Loan.id, literal(returned_at or date.today(), Date), Loan.user_id, Loan.book_id,
+                   Loan.loan_date, Loan.return_date).where(*where)))
+        db.execute(delete(Loan).where(*where))
+    return user_ids
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def create_partitions(db: Session, start: date, months: int = 12) -> list[str]:
+    """Create the missing monthly partitions of loan_archive on PostgreSQL."""
+    if db.get_bind().dialect.name != "postgresql":
+        return []
+    created = []
+    for offset in range(months):
+        first_day = _add_months(start, offset)
+        name = f"loan_archive_{first_day:%Y_%m}"
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF loan_archive "
+                        f"FOR VALUES FROM ('{first_day}') TO ('{_add_months(first_day, 1)}')"))
+        created.append(name)
+    db.commit()
+    logging.info(f"Loan archive partitions: {', '.join(created)}")
+    return created
+
+
+@router.get("/admin/loans/history", response_model=list[ArchivedLoanResponse])
+def get_loan_history(start: date, end: date, user_id: int | None = None, book_id: int | None = None,
+                     skip: int = 0, limit: int = Query(100, le=1000), db: Session = Depends(get_read_db)):
+    query = db.query(LoanArchive).filter(LoanArchive.returned_at >= start, LoanArchive.returned_at < end)
+    if user_id is not None:
+        query = query.filter(LoanArchive.user_id == user_id)
+    if book_id is not None:
+        query = query.filter(LoanArchive.book_id == book_id)
+    return query.order_by(LoanArchive.returned_at, LoanArchive.id).offset(skip).limit(limit).all()
+
+
+if __name__ == "__main__":
+    # python -m app.book.archive
+    from app.models import SessionLocal
+
+    with SessionLocal() as session:
+        create_partitions(session, date.today().replace(day=1))
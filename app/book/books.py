@@ -1,17 +1,34 @@
+import enum
 import logging
-from datetime import date
+import os
+from datetime import date, datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 
-from app.models import Author, Book, get_db
-from app.user.auth import check_admin
+from app import idempotency, queries
+from app.book.archive import archive_loans
+from app.models import (Book, BookFile, BookPair, BranchInventory, Loan, Reservation, User, book_authors, get_db,
+                        get_read_db)
+from app.stats import stats
+from app.streaming import STREAM_BATCH_SIZE, json_array
+from app.user.auth import check_admin, get_current_user
 
 router = APIRouter()  # admin router
-logging.basicConfig(filename='app.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+
+
+class LoanPolicy(str, enum.Enum):
+    """What deleting a book does with its active loans."""
+    REFUSE = "refuse"  # 409 while a copy is on loan
+    SOFT_DELETE = "soft_delete"  # hide the book from the catalog, the loans are returned as usual
+    ARCHIVE = "archive"  # end the loans, they are moved to the loan history
+
+
+BOOK_DELETE_LOANS = LoanPolicy(os.getenv("BOOK_DELETE_LOANS", LoanPolicy.REFUSE.value))
 
 
 class BookCreate(BaseModel):
@@ -23,6 +40,26 @@ class BookCreate(BaseModel):
     copies: Optional[int] = 1
 
 
+class BookPatch(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    publication: Optional[date] = None
+    authors: Optional[list[int]] = None
+    style: Optional[str] = None
+    copies: Optional[int] = None
+
+
+class BooksDelete(BaseModel):
+    ids: list[int]
+    loans: LoanPolicy = BOOK_DELETE_LOANS
+
+
+class BooksDeleteResult(BaseModel):
+    deleted: list[int]
+    soft_deleted: list[int]
+    not_found: list[int]
+
+
 class AuthorResponse(BaseModel):
     id: int
     name: str
@@ -58,67 +95,42 @@ class BookResponse(BaseModel):
 
 
 @router.post("/book/create", response_model=BookResponse, dependencies=[Depends(check_admin)])
-def create_book(book: BookCreate, db: Session = Depends(get_db)):
+def create_book(book: BookCreate, request: Request, current_user: User = Depends(get_current_user),
+                db: Session = Depends(get_db)):
+    key = idempotency.scoped_key(request, current_user.id)
+    hashed = idempotency.request_hash(request, book)
+    replayed = idempotency.replay(db, key, hashed)
+    if replayed:
+        return replayed
     try:
-        db_authors = db.query(Author).filter(Author.id.in_(book.authors)).all()
+        db_authors = db.scalars(queries.authors_by_ids, {"author_ids": book.authors}).all()
         if len(db_authors) != len(book.authors):
             raise HTTPException(status_code=400, detail="Some authors were not found.")
 
+        # loans=[]: a new book has none, the response must not load them
         db_book = Book(title=book.title, description=book.description, publication=book.publication,
-                       authors=db_authors, style=book.style, copies=book.copies)
+                       authors=db_authors, style=book.style, copies=book.copies, loans=[])
         db.add(db_book)
-        db.commit()
-        db.refresh(db_book)
-        logging.info(f"Created book with ID: {db_book.id}")
-        return db_book
+        stats.book_created(db, db_book)
+        # the id comes back from the INSERT, the response is built before the commit expires the book
+        db.flush()
+        response = book_response(db_book)
+        idempotency.save(db, key, hashed, response)
+        replayed = idempotency.commit(db, key, hashed)
+        if replayed:
+            return replayed
+        logging.info(f"Created book with ID: {response.id}")
+        return response
+    except HTTPException:
+        raise
+    except IntegrityError:
+        # a concurrent change, e.g. an author deleted meanwhile; not a bad request
+        raise HTTPException(status_code=409, detail="The book conflicts with a concurrent change, retry the request.")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/book/get", response_model=list[BookResponse])
-def get_all_books(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    books = db.query(Book).offset(skip).limit(limit).all()
-    book_responses = []
-    for book in books:
-        author_responses = [
-            AuthorResponse(
-                id=author.id,
-                name=author.name,
-                bio=author.bio,
-                bday=author.bday
-            )
-            for author in book.authors
-        ]
-        loan_responses = [
-            LoanResponse(
-                id=loan.id,
-                user_id=loan.user_id,
-                book_id=loan.book_id,
-                loan_date=loan.loan_date,
-                due_date=loan.return_date
-            )
-            for loan in book.loans
-        ]
-        book_responses.append(
-            BookResponse(
-                id=book.id,
-                title=book.title,
-                description=book.description,
-                publication=book.publication,
-                authors=author_responses,
-                style=book.style,
-                copies=book.copies,
-                loans=loan_responses
-            )
-        )
-    return book_responses
-
-
-@router.get("/book/get/{book_id}", response_model=BookResponse)
-def get_book_by_id(book_id: int, db: Session = Depends(get_db)):
-    book = db.query(Book).filter(Book.id == book_id).first()
-    if book is None:
-        raise HTTPException(status_code=404, detail="Book not found")
+def book_response(book: Book) -> BookResponse:
     author_responses = [
         AuthorResponse(
             id=author.id,
@@ -150,59 +162,123 @@ def get_book_by_id(book_id: int, db: Session = Depends(get_db)):
     )
 
 
-@router.put("/book/update/{book_id}", response_model=BookResponse, dependencies=[Depends(check_admin)])
-def update_book_by_id(book_id: int, book: BookCreate, db: Session = Depends(get_db)):
-    db_book = db.query(Book).filter(Book.id == book_id).first()
+# ?stream=true sends the page as it is read from the database instead of building it first,
+# ?branch_id= lists only the books with a copy on the shelf of that branch
+@router.get("/book/get", response_model=list[BookResponse])
+def get_all_books(skip: int = 0, limit: int = 10, stream: bool = False, branch_id: int | None = None,
+                  db: Session = Depends(get_read_db)):
+    where = [Book.deleted_at.is_(None)]
+    if branch_id is not None:
+        where.append(queries.available_at_branch(branch_id))
+    if not stream:
+        books = db.query(Book).filter(*where).offset(skip).limit(limit).all()
+        return [book_response(book) for book in books]
+
+    # selectinload loads authors and loans of each fetched batch with one query per relationship
+    result = db.scalars(select(Book)
+                        .options(selectinload(Book.authors), selectinload(Book.loans))
+                        .where(*where)
+                        .order_by(Book.id)
+                        .offset(skip).limit(limit)
+                        .execution_options(yield_per=STREAM_BATCH_SIZE))
+
+    # the session holds unchanged rows weakly, a batch is freed once it has been sent
+    return json_array([book_response(book) for book in books] for books in result.partitions())
+
+
+@router.get("/book/get/{book_id}", response_model=BookResponse)
+def get_book_by_id(book_id: int, db: Session = Depends(get_read_db)):
+    book = db.scalars(queries.book_by_id, {"book_id": book_id}).first()
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book_response(book)
+
+
+def set_book_authors(db: Session, book_id: int, author_ids: list[int]):
+    """Change the authors of a book with only the needed deletes and inserts on book_authors."""
+    wanted = set(author_ids)
+    if len(db.scalars(queries.author_ids_by_ids, {"author_ids": list(wanted)}).all()) != len(wanted):
+        raise HTTPException(status_code=400, detail="Some authors were not found.")
+    current = set(db.scalars(queries.author_ids_by_book, {"book_id": book_id}))
+    removed, added = current - wanted, wanted - current
+    if removed:
+        db.execute(delete(book_authors).where(book_authors.c.book_id == book_id,
+                                              book_authors.c.author_id.in_(removed)))
+    if added:
+        db.execute(insert(book_authors), [{"book_id": book_id, "author_id": author_id} for author_id in added])
+
+
+def update_book(db: Session, book_id: int, changes: dict) -> BookResponse:
+    db_book = db.scalars(queries.book_by_id, {"book_id": book_id}).first()
     if db_book is None:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    db_book.title = book.title
-    db_book.description = book.description
-    db_book.publication = book.publication
-    db_book.authors = db.query(Author).filter(Author.id.in_(book.authors)).all()
-    db_book.style = book.style
-    db_book.copies = book.copies
+    if "authors" in changes:
+        set_book_authors(db, book_id, changes.pop("authors"))
+        # changed behind the ORM, loaded again for the response
+        db.expire(db_book, ["authors"])
+    if "style" in changes:
+        stats.book_style_changed(db, db_book.style, changes["style"])
+    for field, value in changes.items():
+        setattr(db_book, field, value)
     db.commit()
-    db.refresh(db_book)
-    author_responses = [
-        AuthorResponse(
-            id=author.id,
-            name=author.name,
-            bio=author.bio,
-            bday=author.bday
-        )
-        for author in db_book.authors
-    ]
-    loan_responses = [
-        LoanResponse(
-            id=loan.id,
-            user_id=loan.user_id,
-            book_id=loan.book_id,
-            loan_date=loan.loan_date,
-            due_date=loan.return_date
-        )
-        for loan in db_book.loans
-    ]
     logging.info(f"Updated book with ID: {db_book.id}")
-    return BookResponse(
-        id=db_book.id,
-        title=db_book.title,
-        description=db_book.description,
-        publication=db_book.publication,
-        authors=author_responses,
-        style=db_book.style,
-        copies=db_book.copies,
-        loans=loan_responses
-    )
+    return book_response(db_book)
+
+
+@router.put("/book/update/{book_id}", response_model=BookResponse, dependencies=[Depends(check_admin)])
+def update_book_by_id(book_id: int, book: BookCreate, db: Session = Depends(get_db)):
+    return update_book(db, book_id, book.model_dump())
 
 
+# only the fields sent are changed, null leaves a field as it is
+@router.patch("/book/update/{book_id}", response_model=BookResponse, dependencies=[Depends(check_admin)])
+def patch_book_by_id(book_id: int, book: BookPatch, db: Session = Depends(get_db)):
+    return update_book(db, book_id, book.model_dump(exclude_unset=True, exclude_none=True))
+
+
+def delete_books(db: Session, book_ids: list[int], loans: LoanPolicy) -> BooksDeleteResult:
+    """Delete books and the rows that depend on them with set-based statements, in the current transaction."""
+    ids = set(db.scalars(select(Book.id).where(Book.id.in_(book_ids))))
+    on_loan = set(db.scalars(select(Loan.book_id).where(Loan.book_id.in_(ids)).distinct())) if ids else set()
+    if on_loan and loans == LoanPolicy.REFUSE:
+        raise HTTPException(status_code=409, detail=f"Books are on loan: {sorted(on_loan)}")
+    soft = on_loan if loans == LoanPolicy.SOFT_DELETE else set()
+    hard = ids - soft
+
+    stats.books_deleted(db, list(ids))
+    # the waitlist of a book that is gone can't be served
+    db.execute(delete(Reservation).where(Reservation.book_id.in_(ids)))
+    # the branch shelves are emptied, as copies is zeroed for a soft deleted book
+    db.execute(delete(BranchInventory).where(BranchInventory.book_id.in_(ids)))
+    if soft:
+        db.execute(update(Book).where(Book.id.in_(soft)).values(deleted_at=datetime.now(), copies=0))
+    if on_loan and loans == LoanPolicy.ARCHIVE:
+        stats.loans_closed(db, archive_loans(db, Loan.book_id.in_(on_loan)))
+    if hard:
+        db.execute(delete(BookPair).where(or_(BookPair.book_id.in_(hard), BookPair.related_id.in_(hard))))
+        db.execute(delete(book_authors).where(book_authors.c.book_id.in_(hard)))
+        # the blobs stay in the storage, other books may share them
+        db.execute(delete(BookFile).where(BookFile.book_id.in_(hard)))
+        db.execute(delete(Book).where(Book.id.in_(hard)))
+    return BooksDeleteResult(deleted=sorted(hard), soft_deleted=sorted(soft),
+                             not_found=sorted(set(book_ids) - ids))
+
+
+# ?loans= picks what happens to the active loans of the book, see LoanPolicy
 @router.delete("/book/delete/{book_id}", response_model=dict, dependencies=[Depends(check_admin)])
-def delete_book_by_id(book_id: int, db: Session = Depends(get_db)):
-    db_book = db.query(Book).filter(Book.id == book_id).first()
-    if db_book is None:
+def delete_book_by_id(book_id: int, loans: LoanPolicy = BOOK_DELETE_LOANS, db: Session = Depends(get_db)):
+    result = delete_books(db, [book_id], loans)
+    if result.not_found:
         raise HTTPException(status_code=404, detail="Book not found")
+    db.commit()
+    logging.info(f"Deleted book with ID: {book_id}, loans: {loans.value}")
+    return {"detail": "Delete book", "ID": str(book_id)}
+
 
-    db.delete(db_book)
+@router.post("/admin/books/delete", response_model=BooksDeleteResult, dependencies=[Depends(check_admin)])
+def delete_books_by_ids(books: BooksDelete, db: Session = Depends(get_db)):
+    result = delete_books(db, books.ids, books.loans)
     db.commit()
-    logging.info(f"Deleted book with ID: {db_book.id}")
-    return {"detail": "Delete book", "ID": str(db_book.id)}
+    logging.info(f"Deleted books: {result.deleted}, soft deleted: {result.soft_deleted}, loans: {books.loans.value}")
+    return result
@@ -0,0 +1,162 @@
+# covers and attachments of books, the content is kept by app.storage
+import logging
+import os
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app import queries, storage
+from app.models import BookFile, get_db, get_read_db
+from app.user.auth import check_admin
+
+router = APIRouter()
+
+COVER_TYPES = {"image/jpeg", "image/png", "image/webp"}
+ATTACHMENT_TYPES = {"application/pdf"}
+# a cover can be replaced under the same URL, after this clients revalidate it with the ETag
+COVER_CACHE_SECONDS = int(os.getenv("COVER_CACHE_SECONDS", 3600))
+# an attachment URL always serves the same content
+ATTACHMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class BookFileResponse(BaseModel):
+    id: int
+    book_id: int
+    kind: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+
+    class Config:
+        from_attributes = True
+
+
+def _content_type(request: Request, allowed: set[str]) -> str:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in allowed:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Content-Type must be one of: {', '.join(sorted(allowed))}.")
+    return content_type
+
+
+def _attach(db: Session, book_id: int, kind: str, filename: str, content_type: str, sha256: str,
+            size: int) -> BookFileResponse:
+    if kind == "cover":
+        # the old cover's blob stays, other files may share it
+        db.query(BookFile).filter(BookFile.book_id == book_id, BookFile.kind == "cover").delete(
+            synchronize_session=False)
+    db_file = queries.insert_returning(db, BookFile, book_id=book_id, kind=kind, filename=filename,
+                                       content_type=content_type, sha256=sha256, size=size,
+                                       created_at=datetime.now())
+    response = BookFileResponse.model_validate(db_file)
+    db.commit()
+    logging.info(f"Stored {kind} {sha256} ({size} bytes) of the book with ID: {book_id}")
+    return response
+
+
+async def _upload(request: Request, db: Session, book_id: int, kind: str, filename: str,
+                  allowed: set[str]) -> BookFileResponse:
+    """Stream the request body into the storage and attach it to the book."""
+    content_type = _content_type(request, allowed)
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > storage.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                            detail=f"The file is larger than {storage.MAX_UPLOAD_BYTES} bytes.")
+    # the session is used from the threadpool, like in the sync endpoints
+    book = await run_in_threadpool(lambda: db.scalars(queries.book_by_id, {"book_id": book_id}).first())
+    if book is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found.")
+    try:
+        sha256, size = await storage.save_stream(request.stream(), storage.MAX_UPLOAD_BYTES)
+    except storage.UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    if size == 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The file is empty.")
+    # without Pillow a cover is taken by its Content-Type
+    if kind == "cover" and storage.Image is not None:
+        try:
+            await run_in_threadpool(storage.verify_image, sha256)
+        except storage.InvalidImage as e:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    return await run_in_threadpool(_attach, db, book_id, kind, filename, content_type, sha256, size)
+
+
+def _file_response(request: Request, path: str, etag: str, media_type: str, cache_control: str,
+                   filename: str = None) -> Response:
+    """The file with sendfile where the server supports it, Range requests and a 304 for a matching ETag."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if not os.path.isfile(path):
+        logging.error(f"Stored file {path} is missing")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+
+
+def _cover(db: Session, book_id: int) -> BookFile:
+    cover = db.query(BookFile).filter(BookFile.book_id == book_id, BookFile.kind == "cover").first()
+    if cover is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cover not found.")
+    return cover
+
+
+# the image is the request body, e.g. curl -T cover.jpg -H "Content-Type: image/jpeg"
+@router.put("/book/{book_id}/cover", response_model=BookFileResponse, dependencies=[Depends(check_admin)])
+async def upload_cover(book_id: int, request: Request, db: Session = Depends(get_db)):
+    return await _upload(request, db, book_id, "cover", "cover", COVER_TYPES)
+
+
+@router.post("/book/{book_id}/attachments", response_model=BookFileResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(check_admin)])
+async def upload_attachment(book_id: int, filename: str, request: Request, db: Session = Depends(get_db)):
+    filename = os.path.basename(filename.replace("\\", "/")).strip()
+    if not filename:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The filename is empty.")
+    return await _upload(request, db, book_id, "attachment", filename, ATTACHMENT_TYPES)
+
+
+@router.get("/book/{book_id}/files", response_model=list[BookFileResponse])
+def get_book_files(book_id: int, db: Session = Depends(get_read_db)):
+    return db.query(BookFile).filter(BookFile.book_id == book_id).order_by(BookFile.id).all()
+
+
+@router.get("/book/{book_id}/cover")
+def get_cover(book_id: int, request: Request, db: Session = Depends(get_read_db)):
+    cover = _cover(db, book_id)
+    return _file_response(request, storage.blob_path(cover.sha256), f'"{cover.sha256}"', cover.content_type,
+                          f"public, max-age={COVER_CACHE_SECONDS}")
+
+
+# generated on the first request for a size, then served from the disk cache
+@router.get("/book/{book_id}/cover/thumbnail")
+def get_cover_thumbnail(book_id: int, request: Request, size: int = 256, db: Session = Depends(get_read_db)):
+    if size not in storage.THUMBNAIL_SIZES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"size must be one of: {', '.join(map(str, storage.THUMBNAIL_SIZES))}.")
+    if storage.Image is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Thumbnails need Pillow installed.")
+    cover = _cover(db, book_id)
+    try:
+        path = storage.thumbnail(cover.sha256, size)
+    except storage.InvalidImage as e:
+        # stored before the covers were checked, or while Pillow was not installed
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+    return _file_response(request, path, f'"{cover.sha256}-{size}"', "image/jpeg",
+                          f"public, max-age={COVER_CACHE_SECONDS}")
+
+
+@router.get("/book/{book_id}/attachments/{file_id}")
+def get_attachment(book_id: int, file_id: int, request: Request, db: Session = Depends(get_read_db)):
+    attachment = (db.query(BookFile)
+                  .filter(BookFile.id == file_id, BookFile.book_id == book_id, BookFile.kind == "attachment")
+                  .first())
+    if attachment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found.")
+    return _file_response(request, storage.blob_path(attachment.sha256), f'"{attachment.sha256}"',
+                          attachment.content_type, ATTACHMENT_CACHE_CONTROL, attachment.filename)
@@ -1,18 +1,25 @@
+import base64
 import datetime
 import logging
 from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.models import Loan, get_db, User, Book
+from app import events, idempotency, queries
+from app.models import Branch, BranchInventory, Loan, Reservation, get_db, get_read_db, User
+from app.ratelimit import checkout_limit
+from app.stats import stats
 from app.user.auth import UserResponse, get_current_user
+from app.book.archive import archive_loan
 from app.book.books import BookResponse
 
 router = APIRouter()
-logging.basicConfig(filename='app.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+
+MAX_LOANS = 5
+LOAN_DAYS = 20
+MAX_PAGE_SIZE = 100
 
 
 class LoanCreate(BaseModel):
@@ -28,51 +35,219 @@ class LoanResponse(BaseModel):
     book_id: int
     loan_date: date
     return_date: date
+    branch_id: int | None = None
     user: UserResponse
     book: BookResponse
 
 
+class MyLoanResponse(BaseModel):
+    id: int
+    book_id: int
+    title: str
+    loan_date: date
+    return_date: date
+    overdue: bool
+
+
+class MyLoansPage(BaseModel):
+    items: list[MyLoanResponse]
+    # pass it as ?cursor= for the next page, None on the last one
+    next_cursor: str | None = None
+
+
+class ReservationResponse(BaseModel):
+    id: int
+    user_id: int
+    book_id: int
+    created_at: datetime.datetime
+    position: int
+
+
+def encode_cursor(return_date: date, loan_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{return_date.isoformat()}:{loan_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        return_date, loan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return date.fromisoformat(return_date), int(loan_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
+def add_loan(db: Session, user_id: int, book_id: int, user_loans: int, branch_id: int | None = None, **event_data):
+    """Add a loan with its stats and event to the current transaction."""
+    db_loan = Loan(user_id=user_id,
+                   book_id=book_id,
+                   branch_id=branch_id,
+                   loan_date=date.today(),
+                   return_date=date.today() + datetime.timedelta(days=LOAN_DAYS))
+    db.add(db_loan)
+    stats.loan_taken(db, db_loan, first_loan=user_loans == 0)
+    db.flush()
+    event = events.publish(db, "loan.taken", {"loan_id": db_loan.id, "user_id": user_id, "book_id": book_id,
+                                              "branch_id": branch_id, "return_date": db_loan.return_date,
+                                              **event_data})
+    return db_loan, event
+
+
+def take_copy(db: Session, book_id: int, branch_id: int | None = None) -> bool:
+    """Take a copy of the book at the branch, or one without a branch, False when none is left."""
+    if db.get_bind().dialect.update_returning:
+        if branch_id is None:
+            taken = db.scalars(queries.take_copy, {"book_id": book_id})
+        else:
+            taken = db.scalars(queries.take_branch_copy, {"b_book_id": book_id, "b_branch_id": branch_id})
+        return taken.first() is not None
+    db_book = db.scalars(queries.book_by_id.with_for_update(), {"book_id": book_id}).first()
+    if db_book is None:
+        return False
+    stock = db_book if branch_id is None else db.get(BranchInventory, (book_id, branch_id), with_for_update=True)
+    if stock is None or stock.copies < 1:
+        return False
+    stock.copies = stock.copies - 1
+    return True
+
+
+def restock(db: Session, book_id: int, branch_id: int | None):
+    """Put a returned copy back on the shelf of the branch, or with the copies without a branch."""
+    if branch_id is None:
+        db_book = db.scalars(queries.book_by_id_for_update, {"book_id": book_id}).first()
+        db_book.copies = db_book.copies + 1
+    else:
+        # the branch's row is created on the first copy returned there
+        stats.bump(db, BranchInventory, BranchInventory.copies, 1, book_id=book_id, branch_id=branch_id)
+
+
+def hand_off(db: Session, book_id: int, branch_id: int | None = None):
+    """Give a returned copy to the first reader in the queue who can still take a book."""
+    queue = (db.query(Reservation)
+             .filter(Reservation.book_id == book_id)
+             .order_by(Reservation.id)
+             .with_for_update()
+             .all())
+    for reservation in queue:
+        user_loans = db.scalar(queries.loan_count_by_user, {"user_id": reservation.user_id})
+        if user_loans >= MAX_LOANS:
+            continue
+        db.delete(reservation)
+        return add_loan(db, reservation.user_id, book_id, user_loans, branch_id, reservation_id=reservation.id)
+    return None, None
+
+
+# ?branch_id= takes the copy from the shelf of that branch
 @router.post("/book/take/{book_id}", response_model=LoanResponse)
-def take_book(book_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def take_book(book_id: int, request: Request, branch_id: int | None = None,
+              current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    db_loan = Loan(user_id=current_user.id,
-                   book_id=book_id,
-                   loan_date=date.today(),
-                   return_date=date.today() + datetime.timedelta(days=20))
+    key = idempotency.scoped_key(request, current_user.id)
+    hashed = idempotency.request_hash(request)
+    replayed = idempotency.replay(db, key, hashed)
+    if replayed:
+        return replayed
+    # after the replay, so retries of a checkout that went through don't use up tokens
+    checkout_limit.check(f"user:{current_user.id}")
 
-    user_loans = len(db.query(Loan).filter(Loan.user_id == current_user.id).all())
-    db_book = db.query(Book).filter(Book.id == book_id).first()
-    if not db_book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found.")
-    copies = db_book.copies - 1
-    if copies < 0:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough copies of books.")
-    if user_loans >= 5:
+    user_loans = db.scalar(queries.loan_count_by_user, {"user_id": current_user.id})
+    if user_loans >= MAX_LOANS or not take_copy(db, book_id, branch_id):
+        db_book = db.scalars(queries.book_by_id, {"book_id": book_id}).first()
+        if not db_book:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found.")
+        if branch_id is not None and db.get(Branch, branch_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Branch not found.")
+        stock = db_book if branch_id is None else db.get(BranchInventory, (book_id, branch_id))
+        if stock is None or stock.copies < 1:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough copies of books.")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User can't take more than 5 books.")
-    db.add(db_loan)
-    db_book.copies = copies
-    db.commit()
-    db.refresh(db_loan)
-    db.refresh(db_book)
+    db_loan, event = add_loan(db, current_user.id, book_id, user_loans, branch_id)
+    # built before the commit, which would expire the loan and the book and reload them
+    response = LoanResponse.model_validate(db_loan, from_attributes=True)
+    idempotency.save(db, key, hashed, response)
+    replayed = idempotency.commit(db, key, hashed)
+    if replayed:
+        return replayed
+    events.dispatch(event)
     logging.info(f"{current_user.username} take the book with ID: {book_id}")
-    return db_loan
+    return response
 
 
+# the reader's own loans, soonest due first
+@router.get("/me/loans", response_model=MyLoansPage)
+def get_my_loans(limit: int = 10, cursor: str | None = None, current_user: User = Depends(get_current_user),
+                 db: Session = Depends(get_read_db)):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # one row more than the page tells whether there is a next one
+    params = {"user_id": current_user.id, "limit": limit + 1}
+    if cursor:
+        params["after_date"], params["after_id"] = decode_cursor(cursor)
+        rows = db.execute(queries.loans_by_user_due_after, params).all()
+    else:
+        rows = db.execute(queries.loans_by_user_due, params).all()
+    today = date.today()
+    items = [MyLoanResponse(id=row.id, book_id=row.book_id, title=row.title, loan_date=row.loan_date,
+                            return_date=row.return_date, overdue=row.return_date < today) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1].return_date, items[-1].id) if len(rows) > limit else None
+    return MyLoansPage(items=items, next_cursor=next_cursor)
+
+
+# ?branch_id= returns the copy to that branch, by default it goes back where it was taken
 @router.delete("/book/return/{book_id}", response_model=dict)
-def return_book(book_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def return_book(book_id: int, branch_id: int | None = None, current_user: User = Depends(get_current_user),
+                db: Session = Depends(get_db)):
     if current_user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
-    db_loan = db.query(Loan).filter(Loan.user_id == current_user.id,
-                                    Loan.book_id == book_id
-                                    ).first()
+    db_loan = db.scalars(queries.loan_by_user_and_book, {"user_id": current_user.id, "book_id": book_id}).first()
     if not db_loan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found loans by user or book")
-    db.delete(db_loan)
-    db_book = db.query(Book).filter(Book.id == db_loan.book_id).first()
-    db_book.copies = db_book.copies + 1
+    if branch_id is None:
+        branch_id = db_loan.branch_id
+    elif db.get(Branch, branch_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Branch not found.")
+    user_loans = db.scalar(queries.loan_count_by_user, {"user_id": current_user.id})
+    stats.loan_returned(db, db_loan, last_loan=user_loans == 1)
+    archive_loan(db, db_loan)
+    returned = events.publish(db, "loan.returned", {"loan_id": db_loan.id, "user_id": current_user.id,
+                                                    "book_id": book_id, "branch_id": branch_id})
+    db.flush()
+    handed_off, taken = hand_off(db, book_id, branch_id)
+    if handed_off is None:
+        restock(db, book_id, branch_id)
     db.commit()
-    db.refresh(db_book)
+    events.dispatch(returned, *([taken] if taken else []))
+    if handed_off is not None:
+        logging.info(f"Book with ID: {book_id} handed off to the reservation of user ID: {handed_off.user_id}")
     logging.info(f"{current_user.username} return the book with ID: {book_id}")
     return {"detail": "Returned book", "book_id": book_id, "user_id": current_user.id}
+
+
+@router.post("/book/reserve/{book_id}", response_model=ReservationResponse, status_code=status.HTTP_201_CREATED)
+def reserve_book(book_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    db_book = db.scalars(queries.book_by_id, {"book_id": book_id}).first()
+    if not db_book:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found.")
+    if db_book.copies > 0 or db.scalar(queries.branch_copies_by_book, {"book_id": book_id}) > 0:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Book is available, take it instead.")
+    if db.query(Reservation).filter(Reservation.user_id == current_user.id, Reservation.book_id == book_id).first():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Book is already reserved by user.")
+
+    db_reservation = Reservation(user_id=current_user.id, book_id=book_id, created_at=datetime.datetime.now())
+    db.add(db_reservation)
+    db.commit()
+    position = db.query(Reservation).filter(Reservation.book_id == book_id,
+                                            Reservation.id <= db_reservation.id).count()
+    logging.info(f"{current_user.username} reserved the book with ID: {book_id}")
+    return ReservationResponse(id=db_reservation.id, user_id=current_user.id, book_id=book_id,
+                               created_at=db_reservation.created_at, position=position)
+
+
+@router.delete("/book/reserve/{book_id}", response_model=dict)
+def cancel_reservation(book_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    deleted = db.query(Reservation).filter(Reservation.user_id == current_user.id,
+                                           Reservation.book_id == book_id).delete(synchronize_session=False)
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found")
+    db.commit()
+    logging.info(f"{current_user.username} cancelled the reservation of the book with ID: {book_id}")
+    return {"detail": "Cancelled reservation", "book_id": book_id, "user_id": current_user.id}
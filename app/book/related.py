@@ -0,0 +1,91 @@
+# "readers also borrowed", counted from loans of the same reader
+import logging
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import delete, func, select, tuple_, union_all
+from sqlalchemy.orm import Session
+
+from app import events, queries
+from app.models import Book, BookPair, Loan, LoanArchive, SessionLocal, get_read_db
+from app.stats.stats import bump
+
+router = APIRouter()
+
+# only the most recent loans of the reader are paired with a new one
+RELATED_HISTORY_LIMIT = int(os.getenv("RELATED_HISTORY_LIMIT", 50))
+# pairs kept per book by the compaction
+RELATED_TOP_K = int(os.getenv("RELATED_TOP_K", 20))
+RELATED_COMPACT_SECONDS = float(os.getenv("RELATED_COMPACT_SECONDS", 60 * 60))
+
+
+class RelatedBookResponse(BaseModel):
+    id: int
+    title: str
+    style: str | None = None
+    count: int
+
+
+def record_loan(db: Session, user_id: int, book_id: int, loan_id: int):
+    """Pair a new loan with the books the reader borrowed before it, once for each reader and pair."""
+    # loan ids only grow, so loans taken after this one are left out even when the event is processed late
+    history = union_all(
+        select(Loan.book_id, Loan.loan_date).where(Loan.user_id == user_id, Loan.id < loan_id),
+        select(LoanArchive.book_id, LoanArchive.loan_date).where(LoanArchive.user_id == user_id,
+                                                                 LoanArchive.id < loan_id),
+    ).subquery()
+    # a book borrowed again was paired with everything before it the first time, the later books paired with it
+    if db.scalars(select(history.c.book_id).where(history.c.book_id == book_id).limit(1)).first() is not None:
+        return
+    others = db.scalars(select(history.c.book_id)
+                        .where(history.c.book_id != book_id)
+                        .group_by(history.c.book_id)
+                        .order_by(func.max(history.c.loan_date).desc())
+                        .limit(RELATED_HISTORY_LIMIT)).all()
+    for other_id in others:
+        bump(db, BookPair, BookPair.count, 1, book_id=book_id, related_id=other_id)
+        bump(db, BookPair, BookPair.count, 1, book_id=other_id, related_id=book_id)
+
+
+def compact(db: Session, top_k: int = RELATED_TOP_K) -> int:
+    """Drop the pairs that are not in the top_k of their book."""
+    ranked = select(BookPair.book_id, BookPair.related_id,
+                    func.row_number().over(partition_by=BookPair.book_id,
+                                           order_by=(BookPair.count.desc(), BookPair.related_id)).label("rank")
+                    ).subquery()
+    pruned = select(ranked.c.book_id, ranked.c.related_id).where(ranked.c.rank > top_k)
+    deleted = db.execute(delete(BookPair).where(tuple_(BookPair.book_id, BookPair.related_id).in_(pruned))).rowcount
+    db.commit()
+    logging.info(f"Compacted related books, removed {deleted} pairs")
+    return deleted
+
+
+@events.subscribe("loan.taken")
+def count_co_borrowing(db: Session, topic: str, payload: dict):
+    record_loan(db, payload["user_id"], payload["book_id"], payload["loan_id"])
+
+
+def compact_job():
+    with SessionLocal() as db:
+        compact(db)
+
+
+compactor = events.PeriodicTask("related-compaction", RELATED_COMPACT_SECONDS, compact_job)
+
+
+@router.get("/book/{book_id}/related", response_model=list[RelatedBookResponse])
+def get_related_books(book_id: int, limit: int = Query(10, le=RELATED_TOP_K), db: Session = Depends(get_read_db)):
+    rows = db.execute(select(Book.id, Book.title, Book.style, BookPair.count)
+                      .join(BookPair, BookPair.related_id == Book.id)
+                      .where(BookPair.book_id == book_id, Book.deleted_at.is_(None))
+                      .order_by(BookPair.count.desc(), BookPair.related_id)
+                      .limit(limit)).all()
+    if not rows and db.scalars(queries.book_by_id, {"book_id": book_id}).first() is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return [RelatedBookResponse(id=id, title=title, style=style, count=count) for id, title, style, count in rows]
+
+
+if __name__ == "__main__":
+    # python -m app.book.related
+    compact_job()
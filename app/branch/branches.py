@@ -0,0 +1,87 @@
+# library branches and the copies of each book on their shelves
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import queries
+from app.models import Branch, BranchInventory, get_db, get_read_db
+from app.user.auth import check_admin
+
+router = APIRouter()
+
+
+class BranchCreate(BaseModel):
+    name: str
+    address: str | None = None
+
+
+class BranchResponse(BranchCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
+class InventoryUpdate(BaseModel):
+    copies: int
+
+
+class InventoryResponse(BaseModel):
+    book_id: int
+    branch_id: int
+    copies: int
+
+
+class BookAvailability(BaseModel):
+    branch_id: int
+    name: str
+    copies: int
+
+
+@router.get("/branch/get", response_model=list[BranchResponse])
+def get_all_branches(db: Session = Depends(get_read_db)):
+    return db.query(Branch).order_by(Branch.id).all()
+
+
+@router.post("/admin/branches", response_model=BranchResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(check_admin)])
+def create_branch(branch: BranchCreate, db: Session = Depends(get_db)):
+    try:
+        db_branch = queries.insert_returning(db, Branch, name=branch.name, address=branch.address)
+        response = BranchResponse.model_validate(db_branch)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Branch already exists.")
+    logging.info(f"Created branch with ID: {response.id}")
+    return response
+
+
+# sets how many copies of the book the branch has on its shelf, the ones on loan are not counted
+@router.put("/admin/branches/{branch_id}/books/{book_id}", response_model=InventoryResponse,
+            dependencies=[Depends(check_admin)])
+def set_branch_copies(branch_id: int, book_id: int, inventory: InventoryUpdate, db: Session = Depends(get_db)):
+    if inventory.copies < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Copies can't be negative.")
+    if db.get(Branch, branch_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Branch not found.")
+    if db.scalars(queries.book_by_id, {"book_id": book_id}).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found.")
+    db.merge(BranchInventory(book_id=book_id, branch_id=branch_id, copies=inventory.copies))
+    db.commit()
+    logging.info(f"Branch ID: {branch_id} has {inventory.copies} copies of the book with ID: {book_id}")
+    return InventoryResponse(book_id=book_id, branch_id=branch_id, copies=inventory.copies)
+
+
+# the branches where the book can be taken right now
+@router.get("/book/get/{book_id}/branches", response_model=list[BookAvailability])
+def get_book_availability(book_id: int, db: Session = Depends(get_read_db)):
+    rows = (db.query(Branch.id, Branch.name, BranchInventory.copies)
+            .join(BranchInventory, BranchInventory.branch_id == Branch.id)
+            .filter(BranchInventory.book_id == book_id, BranchInventory.copies > 0)
+            .order_by(Branch.id)
+            .all())
+    return [BookAvailability(branch_id=branch_id, name=name, copies=copies) for branch_id, name, copies in rows]
@@ -0,0 +1,157 @@
+# compression.py
+# gzip/brotli compression of responses, chunk by chunk so streamed responses stay streamed.
+import os
+import zlib
+
+from app import config  # noqa: F401 (loads .env)
+
+try:
+    import brotli
+except ImportError:  # optional, pip install brotli
+    brotli = None
+
+# in order of preference when the client accepts several
+COMPRESSION_ENCODINGS = [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "br,gzip").split(",") if e.strip()]
+# smaller bodies cost more CPU than they save bandwidth
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_TYPES = [t.strip() for t in os.getenv(
+    "COMPRESSION_TYPES", "application/json,application/x-ndjson,text/csv,text/plain,text/html").split(",") if t.strip()]
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+
+class GzipEncoder:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        # wbits 31: zlib stream with the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes, flush: bool = False) -> bytes:
+        data = self._compressor.compress(chunk)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes, flush: bool = False) -> bytes:
+        data = self._compressor.process(chunk)
+        return data + self._compressor.flush() if flush else data
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+
+
+def choose_encoding(accept_encoding: str, encodings: list[str] = COMPRESSION_ENCODINGS) -> str | None:
+    """Pick the preferred encoding the client accepts, None to send the body as is."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in encodings:
+        if encoding in ENCODERS and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """Compress responses with an allowed content type.
+
+    A body sent in one message is compressed when it is at least minimum_size bytes,
+    a streamed body is compressed and flushed chunk by chunk so the client gets each part
+    as soon as it is produced. Already encoded and partial (Range) responses are left alone.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, content_types: list[str] = None,
+                 encodings: list[str] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types or COMPRESSION_TYPES
+        self.encodings = encodings or COMPRESSION_ENCODINGS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None or passthrough:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not self.should_compress(start, body, more_body):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding]()
+                response_headers = [(name, value) for name, value in start["headers"]
+                                    if name.lower() not in (b"content-length", b"vary")]
+                vary = [value for name, value in start["headers"] if name.lower() == b"vary"]
+                response_headers.append((b"content-encoding", encoding.encode()))
+                response_headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                if not more_body:
+                    data = encoder.compress(body) + encoder.finish()
+                    response_headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": response_headers})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": response_headers})
+
+            if more_body:
+                await send({"type": "http.response.body", "body": encoder.compress(body, flush=True),
+                            "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.compress(body) + encoder.finish()})
+
+        await self.app(scope, receive, send_compressed)
+
+    def should_compress(self, start: dict, body: bytes, more_body: bool) -> bool:
+        if start["status"] < 200 or start["status"] in (204, 206, 304):
+            return False
+        headers = {name.lower(): value for name, value in start["headers"]}
+        if b"content-encoding" in headers or b"content-range" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+        if content_type not in self.content_types:
+            return False
+        if more_body:
+            size = headers.get(b"content-length")
+            return size is None or int(size) >= self.minimum_size
+        return len(body) >= self.minimum_size
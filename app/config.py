@@ -0,0 +1,24 @@
+# config.py
+# Imported by every module that reads the environment, so .env is parsed once per process.
+import logging
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_FILE = 'app.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(module)s - [trace %(trace_id)s] - %(message)s'
+
+
+def configure_logging():
+    from app import tracing
+
+    # LOG_FORMAT needs the trace ids on every record
+    tracing.install_log_ids()
+    logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format=LOG_FORMAT)
+
+
+def utcnow() -> datetime:
+    """The current UTC time without tzinfo, as the DateTime columns keep it."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
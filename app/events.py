@@ -0,0 +1,198 @@
+# events.py
+# Side effects of loans and admin actions run in a background thread.
+# Events are written to the outbox table in the same transaction as the change that caused them,
+# so they survive crashes and are delivered at least once.
+import json
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+from typing import Callable
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import utcnow
+from app.models import OutboxEvent, SessionLocal
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 1000))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", 100))
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", 5))
+EVENT_MAX_ATTEMPTS = int(os.getenv("EVENT_MAX_ATTEMPTS", 10))
+
+handlers: dict[str, list[Callable[[Session, str, dict], None]]] = defaultdict(list)
+
+
+def subscribe(topic: str):
+    """Register a handler for a topic, "*" receives every event.
+
+    A handler is called as handler(db, topic, payload) and writes through db only. Its changes are
+    committed together with marking the event processed, so an event delivered again is not applied twice.
+    """
+    def decorator(handler: Callable[[Session, str, dict], None]):
+        handlers[topic].append(handler)
+        return handler
+    return decorator
+
+
+def publish(db: Session, topic: str, payload: dict) -> OutboxEvent:
+    """Add an event to the caller's transaction, call dispatch() after the commit."""
+    event = OutboxEvent(topic=topic, payload=json.dumps(payload, default=str), created_at=utcnow(), attempts=0)
+    db.add(event)
+    return event
+
+
+def dispatch(*events: OutboxEvent):
+    for event in events:
+        # the id from the identity key, event.id would reload the event expired by the commit
+        worker.notify(inspect(event).identity[0])
+
+
+class EventWorker:
+    """Consumes outbox events in batches from a bounded queue.
+
+    The queue only carries ids of committed events. When it is full, or the process restarts,
+    the events are picked up from the outbox table by the periodic poll instead.
+    """
+
+    _STOP = object()
+
+    def __init__(self, session_factory: sessionmaker, queue_size: int = EVENT_QUEUE_SIZE,
+                 batch_size: int = EVENT_BATCH_SIZE, poll_seconds: float = EVENT_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="event-worker", daemon=True)
+        self._thread.start()
+        logging.info("Event worker started")
+
+    def stop(self, timeout: float = 10):
+        """Process what is already queued, then stop the thread."""
+        if not self.running:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        logging.info("Event worker stopped")
+
+    def notify(self, event_id: int):
+        if not self.running:
+            return
+        try:
+            self.queue.put_nowait(event_id)
+        except queue.Full:
+            logging.warning(f"Event queue is full, event {event_id} is left to the outbox poll")
+
+    def _run(self):
+        self.poll()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                self.poll()
+                continue
+
+            batch, stopping = [], False
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.process(batch)
+            if stopping:
+                # drain whatever was published before shutdown
+                self.poll()
+                return
+
+    def poll(self):
+        """Process pending outbox rows, oldest first."""
+        while True:
+            with self.session_factory() as db:
+                ids = [row.id for row in db.query(OutboxEvent.id)
+                       .filter(OutboxEvent.processed_at.is_(None), OutboxEvent.attempts < EVENT_MAX_ATTEMPTS)
+                       .order_by(OutboxEvent.id)
+                       .limit(self.batch_size)]
+            # failed events wait for the next poll instead of being retried in a tight loop
+            if not ids or self.process(ids) < len(ids):
+                return
+
+    def process(self, event_ids: list[int]) -> int:
+        processed = 0
+        with self.session_factory() as db:
+            events = (db.query(OutboxEvent)
+                      .filter(OutboxEvent.id.in_(event_ids), OutboxEvent.processed_at.is_(None))
+                      .order_by(OutboxEvent.id)
+                      .with_for_update(skip_locked=True)
+                      .all())
+            for event in events:
+                try:
+                    payload = json.loads(event.payload)
+                    # a failed event leaves none of its handlers' changes behind
+                    with db.begin_nested():
+                        for handler in handlers[event.topic] + handlers["*"]:
+                            handler(db, event.topic, payload)
+                    event.processed_at = utcnow()
+                    processed += 1
+                except Exception:
+                    event.attempts += 1
+                    logging.exception(f"Event {event.id} ({event.topic}) failed, attempt {event.attempts}")
+            db.commit()
+        return processed
+
+
+worker = EventWorker(SessionLocal)
+
+
+@subscribe("*")
+def audit(db: Session, topic: str, payload: dict):
+    logging.info(f"Audit {topic}: {payload}")
+
+
+class PeriodicTask:
+    """Runs fn every `seconds` in a background thread until stopped."""
+
+    def __init__(self, name: str, seconds: float, fn: Callable[[], None]):
+        self.name = name
+        self.seconds = seconds
+        self.fn = fn
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.seconds):
+            try:
+                self.fn()
+            except Exception:
+                logging.exception(f"Periodic task {self.name} failed")
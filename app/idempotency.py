@@ -0,0 +1,82 @@
+# idempotency.py
+# Retried POSTs carrying the same Idempotency-Key get the stored response instead of running again.
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from fastapi import HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import utcnow
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+MAX_KEY_LENGTH = 255
+
+
+def scoped_key(request: Request, user_id: int) -> str | None:
+    """Idempotency key of the request, scoped to the user and route so keys can't collide."""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters.")
+    return f"{user_id}:{request.method}:{request.url.path}:{key}"
+
+
+def request_hash(request: Request, body=None) -> str:
+    """Hash of what the request asks for, a key reused for another request must not replay this one."""
+    data = json.dumps([request.method, request.url.path, str(request.url.query), jsonable_encoder(body)],
+                      sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def replay(db: Session, key: str | None, hashed: str | None = None) -> JSONResponse | None:
+    """Stored response of a previous request with this key, if it has not expired."""
+    if key is None:
+        return None
+    record = db.get(IdempotencyKey, key)
+    if record is None:
+        return None
+    if record.expires_at <= utcnow():
+        db.delete(record)
+        db.flush()
+        return None
+    if record.request_hash is not None and record.request_hash != hashed:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail=f"{IDEMPOTENCY_HEADER} was already used for a different request.")
+    return JSONResponse(content=json.loads(record.response), status_code=record.status_code,
+                        headers={"Idempotent-Replayed": "true"})
+
+
+def save(db: Session, key: str | None, hashed: str | None, response, status_code: int = status.HTTP_200_OK):
+    """Store the response in the caller's transaction, so it is committed together with the result."""
+    if key is None:
+        return
+    db.add(IdempotencyKey(key=key, status_code=status_code, response=json.dumps(jsonable_encoder(response)),
+                          request_hash=hashed, expires_at=utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)))
+
+
+def commit(db: Session, key: str | None, hashed: str | None = None) -> JSONResponse | None:
+    """Commit, or return the winner's response when a concurrent request with the same key committed first."""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        stored = replay(db, key, hashed)
+        if stored is None:
+            raise
+        return stored
+    return None
+
+
+def purge_expired(db: Session) -> int:
+    deleted = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= utcnow()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -1,26 +1,123 @@
 # main.py
+import time
 
-from fastapi import FastAPI
+IMPORT_STARTED = time.perf_counter()
 
+import argparse
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import anyio.to_thread
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from app import config, events, idempotency, revocation, sessions, tracing
+from app.compression import CompressionMiddleware
 from app.author import authors
-from app.book import books
+from app.book import archive, books, files, related
 from app.book import loan_books
-from app.models import init_db
-from app.user import auth, admin
+from app.branch import branches
+from app.models import SessionLocal, engine, init_db, replicas, warm_up_pool
+from app.stats import stats
+from app.user import auth, admin, bulk
+from app.user.jwt import ACCESS_TOKEN_EXPIRE_MINUTES, warm_up_crypto
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
+# threads serving the sync endpoints in each worker process
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", 40))
 
-def include_routers():
+
+def include_routers(app: FastAPI):
     app.include_router(authors.router)
     app.include_router(books.router)
     app.include_router(auth.router)
     app.include_router(loan_books.router)
     app.include_router(admin.router)
+    app.include_router(bulk.router)
+    app.include_router(stats.router)
+    app.include_router(archive.router)
+    app.include_router(related.router)
+    app.include_router(branches.router)
+    app.include_router(files.router)
 
 
-app = FastAPI()
-if __name__ == "__main__":
+def warm_up(app: FastAPI) -> dict[str, float]:
+    """Pay the first-request costs before serving, return the milliseconds spent on each step."""
+    report = {"imports": IMPORT_SECONDS * 1000}
+    steps = [
+        ("db_pool", warm_up_pool),
+        ("crypto", warm_up_crypto),
+        # builds the schemas of every request and response model
+        ("schemas", app.openapi),
+    ]
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        report[name] = (time.perf_counter() - started) * 1000
+    return report
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # connections inherited from a parent process must not be shared with it
+    engine.dispose(close=False)
+    report = await run_in_threadpool(warm_up, app)
+    with SessionLocal() as db:
+        await run_in_threadpool(idempotency.purge_expired, db)
+        await run_in_threadpool(sessions.purge_expired, db)
+        await run_in_threadpool(revocation.purge_expired, db, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+        await run_in_threadpool(revocation.denylist.reload, db)
+    events.worker.start()
+    related.compactor.start()
+    revocation.refresher.start()
+    report["startup"] = (time.perf_counter() - started) * 1000
+    app.state.startup_report = report
+    logging.info(f"Worker {os.getpid()} started with {THREADPOOL_SIZE} threads, startup ms: "
+                 + ", ".join(f"{name}={ms:.1f}" for name, ms in report.items()))
+    yield
+    revocation.refresher.stop()
+    related.compactor.stop()
+    events.worker.stop()
+    bulk.shutdown_hash_pool()
+    engine.dispose()
+    if replicas is not None:
+        replicas.dispose()
+
+
+def create_app() -> FastAPI:
+    config.configure_logging()
+    app = FastAPI(lifespan=lifespan, dependencies=[Depends(tracing.trace_handler, scope="function")])
+    app.add_middleware(CompressionMiddleware)
+    # outermost, so the trace covers the compression too
+    app.add_middleware(tracing.TracingMiddleware)
+    include_routers(app)
+    return app
+
+
+# the one app of a worker process, `uvicorn app.main:app` and main() both serve it
+app = create_app()
+
+
+def main():
     import uvicorn
 
-    include_routers()
+    parser = argparse.ArgumentParser(description="Run the library API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--threads", type=int, default=THREADPOOL_SIZE, help="threadpool size of each worker")
+    args = parser.parse_args()
+
+    # read by the workers at import
+    os.environ["THREADPOOL_SIZE"] = str(args.threads)
     init_db()
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
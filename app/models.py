@@ -1,30 +1,116 @@
 # models.py
+import itertools
+import logging
 import os
+import threading
+import time
 from typing import Type
 
+from fastapi import Request, Response
 from pydantic import BaseModel
-from dotenv import load_dotenv
 
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Enum, Table
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Enum, Table, Text, Index, UniqueConstraint
+from sqlalchemy import DDL, create_engine, event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import enum
 
-load_dotenv()
+from app import config  # noqa: F401 (loads .env)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# comma separated list of read replica urls, reads go to the primary when empty
+REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+# after a write the client keeps reading from the primary for this long (replication lag)
+PRIMARY_STICKY_SECONDS = int(os.getenv("PRIMARY_STICKY_SECONDS", 5))
+PRIMARY_STICKY_COOKIE = "db_primary"
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# connections opened at startup so the first requests don't pay for them
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", DB_POOL_SIZE))
+
+engine = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class ReplicaPool:
+    """Round-robin over read replicas, skipping the ones that failed a health check."""
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        self.sessions = [sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url, pool_pre_ping=True))
+                         for url in urls]
+        self._counter = itertools.count()
+        self._down_until = [0.0] * len(urls)
+        self._lock = threading.Lock()
+
+    def mark_down(self, index: int):
+        with self._lock:
+            self._down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+        logging.warning(f"Read replica {index} is unavailable, retry in {REPLICA_RETRY_SECONDS}s")
+
+    def session(self):
+        """Session on the next healthy replica, or None when all of them are down."""
+        start = next(self._counter)
+        for offset in range(len(self.sessions)):
+            index = (start + offset) % len(self.sessions)
+            if self._down_until[index] > time.monotonic():
+                continue
+            db = self.sessions[index]()
+            try:
+                # checkout runs the pool pre-ping, so this is the health check
+                db.connection()
+                return db
+            except OperationalError:
+                db.close()
+                self.mark_down(index)
+        return None
+
+    def check_health(self) -> list[bool]:
+        status = []
+        for index, session in enumerate(self.sessions):
+            try:
+                with session() as db:
+                    db.execute(text("SELECT 1"))
+                with self._lock:
+                    self._down_until[index] = 0.0
+                status.append(True)
+            except OperationalError:
+                self.mark_down(index)
+                status.append(False)
+        return status
+
+    def dispose(self):
+        for session in self.sessions:
+            session.kw["bind"].dispose()
+
+
+replicas = ReplicaPool(REPLICA_URLS) if REPLICA_URLS else None
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
 
 
-def get_db():
+def warm_up_pool(size: int = DB_POOL_WARMUP) -> int:
+    """Open up to size connections at once and return them to the pool."""
+    connections = []
+    try:
+        for _ in range(min(size, DB_POOL_SIZE)):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def get_db(request: Request, response: Response):
+    if replicas is not None and request.method != "GET":
+        # read-after-write: the next reads of this client stay on the primary
+        response.set_cookie(PRIMARY_STICKY_COOKIE, "1", max_age=PRIMARY_STICKY_SECONDS, httponly=True)
     db = SessionLocal()
     try:
         yield db
@@ -32,9 +118,22 @@ def get_db():
         db.close()
 
 
+def get_read_db(request: Request):
+    """Session for read-only endpoints, served by a replica when one is configured and healthy."""
+    db = None
+    if replicas is not None and PRIMARY_STICKY_COOKIE not in request.cookies:
+        db = replicas.session()
+    if db is None:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 book_authors = Table('book_authors', Base.metadata,
                      Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
-                     Column('author_id', Integer, ForeignKey('authors.id'), primary_key=True)
+                     Column('author_id', Integer, ForeignKey('authors.id'), primary_key=True, index=True)
                      )
 
 
@@ -46,10 +145,10 @@ class UserRole(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, index=True, nullable=False)
     email = Column(String, unique=True, index=True)
-    password = Column(String, index=True)
+    password = Column(String)
     role = Column(Enum(UserRole, values_callable=lambda obj: [e.value for e in obj]), default=UserRole.READER)
     loans = relationship("Loan", back_populates="user")
 
@@ -57,7 +156,7 @@ class User(Base):
 class Author(Base):
     __tablename__ = "authors"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, index=True)
     bio = Column(String)
     bday = Column(Date)
@@ -67,13 +166,16 @@ class Author(Base):
 class Book(Base):
     __tablename__ = "books"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, index=True)
     description = Column(String)
     publication = Column(Date)
     authors = relationship("Author", secondary=book_authors, back_populates="books")
     style = Column(String)
+    # copies not assigned to a branch, the branches keep their own counts in branch_inventory
     copies = Column(Integer, default=1)
+    # set when the book was deleted while it was on loan, it is hidden from the catalog
+    deleted_at = Column(DateTime)
     loans = relationship("Loan", back_populates="book")
 
     def to_pydantic(self, pydantic_model: Type[BaseModel]) -> BaseModel:
@@ -82,11 +184,194 @@ class Book(Base):
 
 class Loan(Base):
     __tablename__ = 'loans'
+    __table_args__ = (
+        # a reader's loans by due date, also serves the lookups by user_id alone
+        Index('ix_loans_user_id_return_date', 'user_id', 'return_date'),
+        # ids of archived loans must never be handed out again
+        {'sqlite_autoincrement': True},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False, index=True)
     loan_date = Column(Date, nullable=False)
     return_date = Column(Date, nullable=False)
+    # where the copy was taken, None for the copies without a branch
+    branch_id = Column(Integer, ForeignKey('branches.id'), index=True)
     user = relationship("User", back_populates="loans")
     book = relationship("Book", back_populates="loans")
+
+
+class StyleStats(Base):
+    __tablename__ = 'style_stats'
+
+    style = Column(String, primary_key=True)
+    books = Column(Integer, nullable=False, default=0)
+
+
+class MonthlyLoanStats(Base):
+    __tablename__ = 'monthly_loan_stats'
+
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    loans = Column(Integer, nullable=False, default=0)
+
+
+class BookLoanStats(Base):
+    __tablename__ = 'book_loan_stats'
+
+    book_id = Column(Integer, ForeignKey('books.id'), primary_key=True)
+    loans = Column(Integer, nullable=False, default=0, index=True)
+
+
+class CatalogCounter(Base):
+    __tablename__ = 'catalog_counters'
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    processed_at = Column(DateTime, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class Reservation(Base):
+    __tablename__ = 'reservations'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'book_id', name='uq_reservations_user_id_book_id'),
+        # FIFO queue per book
+        Index('ix_reservations_book_id_id', 'book_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String, primary_key=True)
+    status_code = Column(Integer, nullable=False)
+    response = Column(Text, nullable=False)
+    # sha256 of the request the response belongs to
+    request_hash = Column(String(64))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class LoanArchive(Base):
+    """Returned loans, append only. loans keeps only the active ones."""
+    __tablename__ = 'loan_archive'
+    __table_args__ = (
+        Index('ix_loan_archive_returned_at', 'returned_at'),
+        Index('ix_loan_archive_user_id_loan_date', 'user_id', 'loan_date'),
+        Index('ix_loan_archive_book_id_loan_date', 'book_id', 'loan_date'),
+        {'postgresql_partition_by': 'RANGE (returned_at)'},
+    )
+
+    # no foreign keys, the history outlives deleted users and books
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    # the partition key has to be part of the primary key
+    returned_at = Column(Date, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    book_id = Column(Integer, nullable=False)
+    loan_date = Column(Date, nullable=False)
+    return_date = Column(Date, nullable=False)
+
+
+# monthly partitions are created ahead by `python -m app.book.archive`, the rest lands here
+event.listen(LoanArchive.__table__, "after_create",
+             DDL("CREATE TABLE loan_archive_default PARTITION OF loan_archive DEFAULT").execute_if(dialect="postgresql"))
+
+
+class BookPair(Base):
+    """How many readers borrowed both books, kept for the top related books of each book."""
+    __tablename__ = 'book_pairs'
+    __table_args__ = (
+        Index('ix_book_pairs_book_id_count', 'book_id', 'count'),
+    )
+
+    book_id = Column(Integer, ForeignKey('books.id'), primary_key=True)
+    related_id = Column(Integer, ForeignKey('books.id'), primary_key=True, index=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RevokedToken(Base):
+    """Access tokens revoked before they expire, by their jti claim."""
+    __tablename__ = 'revoked_tokens'
+
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class TokenCutoff(Base):
+    """Every token of the user issued before revoked_at is revoked, e.g. after a role change."""
+    __tablename__ = 'token_cutoffs'
+
+    user_id = Column(Integer, primary_key=True)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+
+
+class UserSession(Base):
+    """A login, the client keeps it alive by exchanging its refresh token, which is stored hashed."""
+    __tablename__ = 'user_sessions'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    # the token this one replaced, presenting it again means it was stolen
+    previous_hash = Column(String(64), unique=True)
+    created_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Branch(Base):
+    __tablename__ = 'branches'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    address = Column(String)
+
+
+class BranchInventory(Base):
+    """Copies of a book on the shelves of a branch, one row per book and branch.
+
+    Checkouts at different branches update different rows, a popular book is not one hot row.
+    """
+    __tablename__ = 'branch_inventory'
+    __table_args__ = (
+        # the books available at a branch
+        Index('ix_branch_inventory_branch_id_book_id', 'branch_id', 'book_id'),
+    )
+
+    book_id = Column(Integer, ForeignKey('books.id'), primary_key=True)
+    branch_id = Column(Integer, ForeignKey('branches.id'), primary_key=True)
+    copies = Column(Integer, nullable=False, default=0)
+
+
+class BookFile(Base):
+    """Cover image or attachment of a book, the content is the stored blob named by its sha256."""
+    __tablename__ = 'book_files'
+    __table_args__ = (
+        Index('ix_book_files_book_id_kind', 'book_id', 'kind'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    kind = Column(String(16), nullable=False)  # cover or attachment
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    # several files can share a blob, it is stored once
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
@@ -0,0 +1,75 @@
+# queries.py
+# Statements of the hot request paths, built once at import.
+# Their compiled SQL is cached by SQLAlchemy, a request only binds the parameters.
+from sqlalchemy import and_, bindparam, exists, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Author, Book, BranchInventory, Loan, User, book_authors
+
+book_by_id = select(Book).where(Book.id == bindparam("book_id"), Book.deleted_at.is_(None))
+
+# also finds deleted books, their loans can still be returned
+book_by_id_for_update = select(Book).where(Book.id == bindparam("book_id")).with_for_update()
+
+# checks that a copy is left and takes it in one statement, the updated book comes back with RETURNING
+take_copy = (update(Book)
+             .where(Book.id == bindparam("book_id"), Book.deleted_at.is_(None), Book.copies > 0)
+             .values(copies=Book.copies - 1)
+             .returning(Book))
+
+authors_by_ids = select(Author).where(Author.id.in_(bindparam("author_ids", expanding=True)))
+
+author_ids_by_ids = select(Author.id).where(Author.id.in_(bindparam("author_ids", expanding=True)))
+
+author_ids_by_book = select(book_authors.c.author_id).where(book_authors.c.book_id == bindparam("book_id"))
+
+loan_count_by_user = select(func.count(Loan.id)).where(Loan.user_id == bindparam("user_id"))
+
+loan_by_user_and_book = (select(Loan)
+                         .where(Loan.user_id == bindparam("user_id"), Loan.book_id == bindparam("book_id"))
+                         .limit(1))
+
+# the same for the shelf of one branch, only that branch's row of the book is locked
+# (b_: the column names are reserved for the SET clause of an UPDATE)
+take_branch_copy = (update(BranchInventory)
+                    .where(BranchInventory.book_id == bindparam("b_book_id"),
+                           BranchInventory.branch_id == bindparam("b_branch_id"),
+                           BranchInventory.copies > 0,
+                           exists().where(Book.id == BranchInventory.book_id, Book.deleted_at.is_(None)))
+                    .values(copies=BranchInventory.copies - 1)
+                    .returning(BranchInventory.copies))
+
+branch_copies_by_book = (select(func.coalesce(func.sum(BranchInventory.copies), 0))
+                         .where(BranchInventory.book_id == bindparam("book_id")))
+
+# a reader's loans by due date, one range scan of ix_loans_user_id_return_date
+loans_by_user_due = (select(Loan.id, Loan.book_id, Book.title, Loan.loan_date, Loan.return_date)
+                     .join(Book, Book.id == Loan.book_id)
+                     .where(Loan.user_id == bindparam("user_id"))
+                     .order_by(Loan.return_date, Loan.id)
+                     .limit(bindparam("limit")))
+
+# the next page starts after the last (return_date, id) of the previous one
+loans_by_user_due_after = loans_by_user_due.where(or_(
+    Loan.return_date > bindparam("after_date"),
+    and_(Loan.return_date == bindparam("after_date"), Loan.id > bindparam("after_id"))))
+
+user_by_email = select(User).where(User.email == bindparam("email"))
+
+user_by_id = select(User).where(User.id == bindparam("user_id"))
+
+
+def available_at_branch(branch_id: int):
+    """Filter of the books with a copy on the shelf of the branch, probes ix_branch_inventory_branch_id_book_id."""
+    return exists().where(BranchInventory.branch_id == branch_id, BranchInventory.book_id == Book.id,
+                          BranchInventory.copies > 0)
+
+
+def insert_returning(db: Session, model, **values):
+    """Insert a row and get it back in the same round trip, the backends without RETURNING flush an object."""
+    if db.get_bind().dialect.insert_returning:
+        return db.scalars(insert(model).values(**values).returning(model)).one()
+    row = model(**values)
+    db.add(row)
+    db.flush()
+    return row
@@ -0,0 +1,110 @@
+# ratelimit.py
+# Token bucket rate limiting for expensive endpoints (login runs bcrypt, checkout several queries).
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from fastapi import HTTPException, Request, status
+
+from app import config  # noqa: F401 (loads .env)
+
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", 64))
+RATE_LIMIT_SWEEP_EVERY = int(os.getenv("RATE_LIMIT_SWEEP_EVERY", 1000))
+# only behind a proxy that sets it, otherwise clients could pick their own key
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+
+class RateLimitBackend(ABC):
+    """Storage for token buckets, implement it to keep them elsewhere (e.g. Redis)."""
+
+    @abstractmethod
+    def hit(self, key: str, rate: float, capacity: int) -> float:
+        """Take one token from the bucket, return 0 if allowed or the seconds until a token is available."""
+
+    @abstractmethod
+    def reset(self):
+        """Drop every bucket."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """In-process buckets split into shards, each with its own lock.
+
+    A bucket that has refilled completely is equal to a missing one, so such buckets are
+    dropped lazily by sweeping one shard every RATE_LIMIT_SWEEP_EVERY hits on it.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, sweep_every: int = RATE_LIMIT_SWEEP_EVERY):
+        self.sweep_every = sweep_every
+        # bucket: key -> (tokens, updated_at, full_at)
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+        self._hits = [0] * shards
+
+    def hit(self, key: str, rate: float, capacity: int) -> float:
+        index = hash(key) % len(self._shards)
+        lock, buckets = self._shards[index]
+        now = time.monotonic()
+        with lock:
+            tokens, updated_at, _ = buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+
+            self._hits[index] += 1
+            if self._hits[index] >= self.sweep_every:
+                self._hits[index] = 0
+                for expired in [k for k, (_, _, full_at) in buckets.items() if full_at <= now]:
+                    del buckets[expired]
+        return wait
+
+    def reset(self):
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+    def __len__(self):
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+backend: RateLimitBackend = MemoryBackend()
+
+
+def parse_limit(limit: str) -> tuple[int, float]:
+    """Parse "5/60" into 5 requests per 60 seconds."""
+    times, seconds = limit.split("/")
+    return int(times), float(seconds)
+
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded and RATE_LIMIT_TRUST_FORWARDED:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """Dependency limiting a route per client IP, call check() directly to limit by another key."""
+
+    def __init__(self, name: str, limit: str, store: RateLimitBackend = None):
+        self.name = name
+        self.capacity, seconds = parse_limit(limit)
+        self.rate = self.capacity / seconds
+        self.store = store
+
+    def check(self, key: str):
+        wait = (self.store or backend).hit(f"{self.name}:{key}", self.rate, self.capacity)
+        if wait > 0:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers={"Retry-After": str(math.ceil(wait))})
+
+    def __call__(self, request: Request):
+        self.check(f"ip:{client_ip(request)}")
+
+
+login_limit = RateLimit("login", os.getenv("RATE_LIMIT_LOGIN", "10/60"))
+checkout_limit = RateLimit("checkout", os.getenv("RATE_LIMIT_CHECKOUT", "30/60"))
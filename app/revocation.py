@@ -0,0 +1,162 @@
+# revocation.py
+# Denylist of revoked access tokens. Every request checks it, so it is kept in memory:
+# a Bloom filter answers "surely not revoked" for almost every token without touching the exact set,
+# the database is read only at startup and by a periodic incremental refresh.
+import hashlib
+import math
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from app import events
+from app.config import utcnow
+from app.models import RevokedToken, SessionLocal, TokenCutoff
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", 5))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", 100_000))
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+# rows committed late with an older revoked_at are still picked up by the next refresh
+REVOCATION_REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+def _timestamp(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class BloomFilter:
+    """Set membership with false positives only, in a fixed number of bits."""
+
+    def __init__(self, capacity: int, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        # double hashing: k positions from two 64 bit hashes
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class Denylist:
+    """Revoked jtis and per-user cutoffs, readers don't lock, writers replace or add under a lock."""
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._bloom = BloomFilter(self.capacity)
+        # jti -> expires_at, the expired ones are dropped by reload()
+        self._jtis: dict[str, datetime] = {}
+        # user_id -> unix time before which the user's tokens are revoked
+        self._cutoffs: dict[int, float] = {}
+        self._watermark: datetime | None = None
+
+    def is_revoked(self, jti: str | None, user_id: int | None, issued_at: float | None) -> bool:
+        cutoff = self._cutoffs.get(user_id)
+        if cutoff is not None and (issued_at or 0) < cutoff:
+            return True
+        return jti is not None and jti in self._bloom and jti in self._jtis
+
+    def add(self, jti: str, expires_at: datetime):
+        with self._lock:
+            if jti in self._jtis:
+                return
+            self._jtis[jti] = expires_at
+            if self._bloom.count >= self._bloom.capacity:
+                self._rebuild(self.capacity * 2)
+            else:
+                self._bloom.add(jti)
+
+    def add_cutoff(self, user_id: int, revoked_at: datetime):
+        with self._lock:
+            self._cutoffs[user_id] = max(self._cutoffs.get(user_id, 0), _timestamp(revoked_at))
+
+    def _rebuild(self, capacity: int):
+        bloom = BloomFilter(max(capacity, len(self._jtis) * 2, 1))
+        for jti in self._jtis:
+            bloom.add(jti)
+        self.capacity = bloom.capacity
+        self._bloom = bloom
+
+    def refresh(self, db: Session) -> int:
+        """Add the revocations made since the last refresh, by this or any other process."""
+        since = self._watermark - REVOCATION_REFRESH_OVERLAP if self._watermark else None
+        started = utcnow()
+        tokens = db.query(RevokedToken.jti, RevokedToken.expires_at)
+        cutoffs = db.query(TokenCutoff.user_id, TokenCutoff.revoked_at)
+        if since is not None:
+            tokens = tokens.filter(RevokedToken.revoked_at >= since)
+            cutoffs = cutoffs.filter(TokenCutoff.revoked_at >= since)
+        loaded = 0
+        for jti, expires_at in tokens:
+            self.add(jti, expires_at)
+            loaded += 1
+        for user_id, revoked_at in cutoffs:
+            self.add_cutoff(user_id, revoked_at)
+            loaded += 1
+        self._watermark = started
+        return loaded
+
+    def reload(self, db: Session) -> int:
+        """Load everything again, which also forgets the expired tokens."""
+        with self._lock:
+            self.clear()
+        loaded = self.refresh(db)
+        now = utcnow()
+        with self._lock:
+            for jti in [jti for jti, expires_at in self._jtis.items() if expires_at <= now]:
+                del self._jtis[jti]
+            self._rebuild(self.capacity)
+        return loaded
+
+    def __len__(self):
+        return len(self._jtis)
+
+
+denylist = Denylist()
+
+
+def revoke_token(db: Session, jti: str, user_id: int, expires_at: datetime):
+    """Revoke one token in the caller's transaction, it is denied in this process right away."""
+    db.merge(RevokedToken(jti=jti, user_id=user_id, revoked_at=utcnow(), expires_at=expires_at))
+    denylist.add(jti, expires_at)
+
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Revoke every token issued to the user until now."""
+    revoked_at = utcnow()
+    db.merge(TokenCutoff(user_id=user_id, revoked_at=revoked_at))
+    denylist.add_cutoff(user_id, revoked_at)
+
+
+def purge_expired(db: Session, token_lifetime: timedelta) -> int:
+    """Delete revocations of tokens that expired anyway, a cutoff is kept for one token lifetime."""
+    now = utcnow()
+    deleted = db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+    deleted += (db.query(TokenCutoff).filter(TokenCutoff.revoked_at <= now - token_lifetime)
+                .delete(synchronize_session=False))
+    db.commit()
+    return deleted
+
+
+def refresh_job():
+    with SessionLocal() as db:
+        denylist.refresh(db)
+
+
+refresher = events.PeriodicTask("token-denylist", REVOCATION_REFRESH_SECONDS, refresh_job)
@@ -0,0 +1,69 @@
+# sessions.py
+# Refresh tokens: a client exchanges one for a new access token instead of logging in again,
+# so only a login pays for bcrypt. Tokens are random, only their sha256 is stored, and every
+# refresh replaces the token, an old one presented again ends the session.
+import hashlib
+import os
+import secrets
+from datetime import timedelta
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import utcnow
+from app.models import UserSession
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+
+
+def hash_token(token: str) -> str:
+    # the token has 256 random bits, a fast hash is enough
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def start_session(db: Session, user_id: int) -> tuple[int, str]:
+    """New session of the user in the caller's transaction, returns its id and refresh token."""
+    token = secrets.token_urlsafe(32)
+    now = utcnow()
+    user_session = UserSession(user_id=user_id, token_hash=hash_token(token), created_at=now, last_used_at=now,
+                               expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    db.add(user_session)
+    db.flush()
+    return user_session.id, token
+
+
+def rotate(db: Session, token: str) -> tuple[int, int, str] | None:
+    """Replace the refresh token, returns the session id, user id and new token, None if it is not valid.
+
+    The swap is one conditional UPDATE, two concurrent refreshes with the same token can't both succeed.
+    """
+    old_hash = hash_token(token)
+    new_token = secrets.token_urlsafe(32)
+    now = utcnow()
+    row = db.execute(
+        update(UserSession)
+        .where(UserSession.token_hash == old_hash, UserSession.expires_at > now)
+        .values(token_hash=hash_token(new_token), previous_hash=old_hash, last_used_at=now,
+                expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        .returning(UserSession.id, UserSession.user_id)
+    ).first()
+    if row is None:
+        # a replaced token is used again: whoever holds the current one may be an attacker
+        db.query(UserSession).filter(UserSession.previous_hash == old_hash).delete(synchronize_session=False)
+        return None
+    return row.id, row.user_id, new_token
+
+
+def end_session(db: Session, session_id: int, user_id: int) -> int:
+    return (db.query(UserSession).filter(UserSession.id == session_id, UserSession.user_id == user_id)
+            .delete(synchronize_session=False))
+
+
+def end_user_sessions(db: Session, user_id: int) -> int:
+    return db.query(UserSession).filter(UserSession.user_id == user_id).delete(synchronize_session=False)
+
+
+def purge_expired(db: Session) -> int:
+    deleted = db.query(UserSession).filter(UserSession.expires_at <= utcnow()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,162 @@
+# catalog statistics, kept up to date by the book and loan routers
+import logging
+from collections import defaultdict
+from datetime import date
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from sqlalchemy import func, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import Book, BookLoanStats, CatalogCounter, Loan, LoanArchive, MonthlyLoanStats, StyleStats, get_db
+from app.user.auth import check_admin
+
+router = APIRouter(dependencies=[Depends(check_admin)])
+
+ACTIVE_READERS = "active_readers"
+TOP_BORROWED_LIMIT = 10
+
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class TopBook(BaseModel):
+    book_id: int
+    title: str
+    loans: int
+
+
+class CatalogStats(BaseModel):
+    books_per_style: dict[str, int]
+    loans_per_month: dict[str, int]
+    top_borrowed: list[TopBook]
+    active_readers: int
+
+
+def bump(db: Session, model, column, delta: int, **key):
+    """Add delta to a counter row, creating the row on first use.
+
+    key must be the primary key of the model. The row is created with an upsert, so two
+    transactions creating the same counter at once both succeed instead of one failing on the key.
+    """
+    if delta <= 0:
+        db.query(model).filter_by(**key).update({column: column + delta}, synchronize_session=False)
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in UPSERTS:
+        db.execute(UPSERTS[dialect](model)
+                   .values(**key, **{column.key: delta})
+                   .on_conflict_do_update(index_elements=list(key), set_={column.key: column + delta}))
+        return
+    updated = db.query(model).filter_by(**key).update({column: column + delta}, synchronize_session=False)
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(model(**key, **{column.key: delta}))
+        except IntegrityError:
+            # created by a concurrent transaction in the meantime
+            db.query(model).filter_by(**key).update({column: column + delta}, synchronize_session=False)
+
+
+def _month(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def book_created(db: Session, book: Book):
+    bump(db, StyleStats, StyleStats.books, 1, style=book.style)
+
+
+def books_deleted(db: Session, book_ids: list[int]):
+    """Take books deleted with bulk statements out of the stats, call it before they are deleted."""
+    for style, books in (db.query(Book.style, func.count(Book.id))
+                         .filter(Book.id.in_(book_ids), Book.deleted_at.is_(None))
+                         .group_by(Book.style)):
+        bump(db, StyleStats, StyleStats.books, -books, style=style)
+    db.query(BookLoanStats).filter(BookLoanStats.book_id.in_(book_ids)).delete(synchronize_session=False)
+
+
+def loans_closed(db: Session, user_ids: set[int]):
+    """Update the active readers after loans of these readers were ended in bulk."""
+    still_active = db.scalar(select(func.count(func.distinct(Loan.user_id))).where(Loan.user_id.in_(user_ids)))
+    bump(db, CatalogCounter, CatalogCounter.value, still_active - len(user_ids), name=ACTIVE_READERS)
+
+
+def book_style_changed(db: Session, old_style: str, new_style: str):
+    if old_style != new_style:
+        bump(db, StyleStats, StyleStats.books, -1, style=old_style)
+        bump(db, StyleStats, StyleStats.books, 1, style=new_style)
+
+
+def loan_taken(db: Session, loan: Loan, first_loan: bool):
+    bump(db, MonthlyLoanStats, MonthlyLoanStats.loans, 1, month=_month(loan.loan_date))
+    bump(db, BookLoanStats, BookLoanStats.loans, 1, book_id=loan.book_id)
+    if first_loan:
+        bump(db, CatalogCounter, CatalogCounter.value, 1, name=ACTIVE_READERS)
+
+
+def loan_returned(db: Session, loan: Loan, last_loan: bool):
+    if last_loan:
+        bump(db, CatalogCounter, CatalogCounter.value, -1, name=ACTIVE_READERS)
+
+
+def rebuild_stats(db: Session):
+    """Recompute every summary table from scratch with GROUP BY queries."""
+    for model in (StyleStats, MonthlyLoanStats, BookLoanStats, CatalogCounter):
+        db.query(model).delete(synchronize_session=False)
+
+    for style, books in (db.query(Book.style, func.count(Book.id))
+                         .filter(Book.deleted_at.is_(None))
+                         .group_by(Book.style).all()):
+        db.add(StyleStats(style=style, books=books))
+
+    # every loan ever taken: the active ones and the archived history
+    all_loans = union_all(select(Loan.book_id, Loan.loan_date),
+                          select(LoanArchive.book_id, LoanArchive.loan_date)).subquery()
+
+    months = defaultdict(int)
+    for loan_date, loans in db.query(all_loans.c.loan_date, func.count()).group_by(all_loans.c.loan_date).all():
+        months[_month(loan_date)] += loans
+    db.add_all(MonthlyLoanStats(month=month, loans=loans) for month, loans in months.items())
+
+    # books deleted since are left out, they are not in the catalog anymore
+    for book_id, loans in (db.query(all_loans.c.book_id, func.count())
+                           .join(Book, Book.id == all_loans.c.book_id)
+                           .filter(Book.deleted_at.is_(None))
+                           .group_by(all_loans.c.book_id).all()):
+        db.add(BookLoanStats(book_id=book_id, loans=loans))
+
+    active_readers = db.query(func.count(func.distinct(Loan.user_id))).scalar()
+    db.add(CatalogCounter(name=ACTIVE_READERS, value=active_readers))
+    db.commit()
+    logging.info("Rebuilt catalog stats")
+
+
+@router.get("/admin/stats", response_model=CatalogStats)
+def get_stats(db: Session = Depends(get_db)):
+    top_borrowed = (db.query(BookLoanStats.book_id, Book.title, BookLoanStats.loans)
+                    .join(Book, Book.id == BookLoanStats.book_id)
+                    .order_by(BookLoanStats.loans.desc())
+                    .limit(TOP_BORROWED_LIMIT)
+                    .all())
+    active_readers = db.query(CatalogCounter.value).filter(CatalogCounter.name == ACTIVE_READERS).scalar()
+    return CatalogStats(
+        books_per_style={row.style: row.books for row in db.query(StyleStats).filter(StyleStats.books > 0)},
+        loans_per_month={row.month: row.loans for row in db.query(MonthlyLoanStats).order_by(MonthlyLoanStats.month)},
+        top_borrowed=[TopBook(book_id=book_id, title=title, loans=loans) for book_id, title, loans in top_borrowed],
+        active_readers=active_readers or 0
+    )
+
+
+@router.post("/admin/stats/rebuild", response_model=CatalogStats)
+def rebuild(db: Session = Depends(get_db)):
+    rebuild_stats(db)
+    return get_stats(db)
+
+
+if __name__ == "__main__":
+    # python -m app.stats.stats
+    from app.models import SessionLocal
+
+    with SessionLocal() as session:
+        rebuild_stats(session)
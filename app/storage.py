@@ -0,0 +1,121 @@
+# storage.py
+# Content-addressed files on local disk: a file is stored once under its sha256, uploading it again
+# reuses the blob. Uploads are streamed to a temporary file and hashed on the way, never held in memory.
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import AsyncIterator
+
+import anyio.to_thread
+
+from app import config  # noqa: F401 (loads .env)
+
+try:
+    from PIL import Image
+except ImportError:  # optional, pip install Pillow
+    Image = None
+
+STORAGE_DIR = os.getenv("STORAGE_DIR", "storage")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+# the only sizes generated, so the thumbnail cache stays bounded
+THUMBNAIL_SIZES = (128, 256, 512)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def blob_path(sha256: str) -> str:
+    # two levels, so no directory ends up with every file
+    return os.path.join(STORAGE_DIR, "blobs", sha256[:2], sha256[2:])
+
+
+def thumbnail_path(sha256: str, size: int) -> str:
+    return os.path.join(STORAGE_DIR, "thumbnails", sha256[:2], f"{sha256[2:]}_{size}.jpg")
+
+
+def _temporary_file(kind: str):
+    directory = os.path.join(STORAGE_DIR, "tmp")
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, prefix=kind, delete=False)
+
+
+def _move(temporary: str, path: str):
+    """Rename the finished file into place, so a reader never sees a partly written one."""
+    if os.path.exists(path):
+        # the same content is stored already
+        os.remove(temporary)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temporary, path)
+
+
+def _write(file, digest, chunk: bytes):
+    digest.update(chunk)
+    file.write(chunk)
+
+
+async def save_stream(chunks: AsyncIterator[bytes], max_bytes: int = MAX_UPLOAD_BYTES) -> tuple[str, int]:
+    """Store the streamed content, return its sha256 and size. Raises UploadTooLarge past max_bytes."""
+    file = _temporary_file("upload")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"The file is larger than {max_bytes} bytes.")
+            if chunk:
+                # disk writes and hashing in a worker thread, the event loop keeps serving
+                await anyio.to_thread.run_sync(_write, file, digest, chunk)
+        file.close()
+        sha256 = digest.hexdigest()
+        await anyio.to_thread.run_sync(_move, file.name, blob_path(sha256))
+        return sha256, size
+    except BaseException:
+        file.close()
+        if os.path.exists(file.name):
+            os.remove(file.name)
+        raise
+
+
+@contextmanager
+def _image(sha256: str):
+    """Open an image blob, InvalidImage when Pillow cannot read it. Needs Pillow."""
+    try:
+        with Image.open(blob_path(sha256)) as image:
+            yield image
+    except FileNotFoundError:
+        raise
+    # a broken file fails in decoding with any of these
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(f"The file is not a readable image: {e}") from e
+
+
+def verify_image(sha256: str):
+    with _image(sha256) as image:
+        image.verify()
+
+
+def thumbnail(sha256: str, size: int) -> str:
+    """Path of the JPEG thumbnail of an image blob, generated on first use. Needs Pillow."""
+    path = thumbnail_path(sha256, size)
+    if os.path.exists(path):
+        return path
+    with _image(sha256) as image:
+        image.thumbnail((size, size))
+        file = _temporary_file("thumbnail")
+        try:
+            image.convert("RGB").save(file, "JPEG", quality=85)
+            file.close()
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    _move(file.name, path)
+    return path
@@ -0,0 +1,29 @@
+# streaming.py
+# Large list pages written to the client as a JSON array item by item.
+# Memory use and time to first byte depend on the batch size, not on the page size.
+import os
+from typing import Iterable
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app import config  # noqa: F401 (loads .env)
+
+# rows fetched from the cursor and serialized at a time
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 100))
+
+
+def json_array(batches: Iterable[Iterable[BaseModel]]) -> StreamingResponse:
+    """Stream the items of the batches as one JSON array, a batch is serialized only when it is sent."""
+    def body():
+        yield b"["
+        first = True
+        for batch in batches:
+            chunk = b",".join(item.model_dump_json().encode() for item in batch)
+            if not chunk:
+                continue
+            yield chunk if first else b"," + chunk
+            first = False
+        yield b"]"
+
+    return StreamingResponse(body(), media_type="application/json")
@@ -0,0 +1,304 @@
+# tracing.py
+# Lightweight request tracing: where the time of a request went (auth, database, relationship loading,
+# serialization). Spans live in contextvars, sampled traces are written in the OTLP JSON format,
+# so a file can be loaded by an OpenTelemetry collector (filelog / otlpjsonfile receiver).
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import config  # noqa: F401 (loads .env)
+
+# share of requests whose spans are recorded, trace ids are put into the logs either way
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.0))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")  # file, console or none
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# only behind upstreams that send traceparent themselves, otherwise any client could have its requests recorded
+TRACE_TRUST_PARENT = os.getenv("TRACE_TRUST_PARENT", "false").lower() == "true"
+SERVICE_NAME = "library-api"
+MAX_STATEMENT_LENGTH = 500
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "handler_end_ns")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        # when the path operation returned, what follows until the response starts is serialization
+        self.handler_end_ns = None
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes", "start_ns", "end_ns", "error")
+
+    INTERNAL = 1
+    SERVER = 2
+
+    def __init__(self, trace: Trace, name: str, parent_id: str | None = None, attributes: dict = None,
+                 start_ns: int = None, kind: int = INTERNAL):
+        self.trace = trace
+        self.kind = kind
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def end(self, end_ns: int = None):
+        self.end_ns = end_ns or time.time_ns()
+        if self.trace.sampled:
+            self.trace.spans.append(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, trace: Trace):
+        """Send the finished spans of a sampled trace."""
+
+
+class StreamExporter(SpanExporter):
+    """One OTLP JSON ExportTraceServiceRequest per line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in trace.spans]}],
+        }]})
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class FileExporter(StreamExporter):
+    def __init__(self, path: str = TRACE_FILE):
+        super().__init__(open(path, "a", encoding="utf-8"))
+
+
+def _default_exporter() -> SpanExporter | None:
+    if TRACE_EXPORTER == "console":
+        return StreamExporter(sys.stderr)
+    if TRACE_EXPORTER == "file":
+        return FileExporter()
+    return None
+
+
+exporter: SpanExporter | None = None
+
+
+def get_exporter() -> SpanExporter | None:
+    global exporter
+    if exporter is None:
+        exporter = _default_exporter()
+    return exporter
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """W3C traceparent "00-<trace id>-<parent span id>-<flags>" of the caller."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or set(parts[1]) == {"0"}:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+
+@contextmanager
+def start_trace(name: str, traceparent: str = None, sample_rate: float = None, **attributes):
+    """Root span of a request, continues the caller's trace when it sent a traceparent.
+
+    The caller's sampled flag is followed with TRACE_TRUST_PARENT only, otherwise the local rate decides.
+    """
+    parent = parse_traceparent(traceparent)
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if parent and TRACE_TRUST_PARENT:
+        trace_id, parent_id, sampled = parent
+    elif parent:
+        trace_id, parent_id, _ = parent
+        sampled = random.random() < rate
+    else:
+        trace_id, parent_id, sampled = _new_id(128), None, random.random() < rate
+    root = Span(Trace(trace_id, sampled), name, parent_id, attributes, kind=Span.SERVER)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+        span_exporter = get_exporter() if root.trace.sampled else None
+        if span_exporter is not None:
+            try:
+                span_exporter.export(root.trace)
+            except Exception:
+                logging.exception("Exporting a trace failed")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one, does nothing outside a sampled trace."""
+    parent = _current.get()
+    if parent is None or not parent.trace.sampled:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def current_ids() -> tuple[str, str] | None:
+    current = _current.get()
+    return (current.trace.trace_id, current.span_id) if current else None
+
+
+async def trace_handler():
+    """App dependency with scope="function": its span covers the dependencies and the path operation."""
+    with span("handler"):
+        yield
+    current = _current.get()
+    if current is not None:
+        current.trace.handler_end_ns = time.time_ns()
+
+
+class TracingMiddleware:
+    """Starts a trace for each request and answers with its traceparent."""
+
+    def __init__(self, app, sample_rate: float = None):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        with start_trace(f"{scope['method']} {scope['path']}", traceparent, self.sample_rate,
+                         **{"http.request.method": scope["method"], "url.path": scope["path"]}) as root:
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    now = time.time_ns()
+                    root.attributes["http.response.status_code"] = message["status"]
+                    if root.trace.handler_end_ns is not None:
+                        Span(root.trace, "serialize", root.span_id, start_ns=root.trace.handler_end_ns).end(now)
+                    flags = "01" if root.trace.sampled else "00"
+                    message = {**message, "headers": [
+                        *message.get("headers", []),
+                        (b"traceparent", f"00-{root.trace.trace_id}-{root.span_id}-{flags}".encode())]}
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+
+# database round trips of every engine, with the statement
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is not None and parent.trace.sampled:
+        conn.info.setdefault("trace_spans", []).append(
+            Span(parent.trace, "db.query", parent.span_id,
+                 {"db.system": conn.dialect.name, "db.statement": statement[:MAX_STATEMENT_LENGTH],
+                  "db.executemany": executemany}))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().end()
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        failed = spans.pop()
+        failed.error = repr(context.original_exception)
+        failed.end()
+
+
+# lazy and eager relationship loads, their queries become children of the span
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_relationship_load:
+        return None
+    parent = _current.get()
+    if parent is None or not parent.trace.sampled:
+        return None
+    with span("orm.relationship_load", **{"orm.path": str(orm_execute_state.loader_strategy_path)}):
+        return orm_execute_state.invoke_statement()
+
+
+def install_log_ids():
+    """Add trace_id and span_id to every log record."""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "adds_trace_ids", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        ids = current_ids()
+        record.trace_id, record.span_id = ids if ids else ("-", "-")
+        return record
+
+    record_factory.adds_trace_ids = True
+    logging.setLogRecordFactory(record_factory)
@@ -4,17 +4,17 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from app.models import get_db, User
+from app import events, queries, sessions
+from app.models import get_db, get_read_db, replicas, User, UserRole
+from app.revocation import revoke_user_tokens
 from app.user.auth import UserResponse, UserUpdate, check_admin
 from app.user.jwt import get_password_hash
 
 router = APIRouter(dependencies=[Depends(check_admin)])
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %('
-                                                                   'message)s')
 
 
 @router.get("/admin/users/get", response_model=list[UserResponse])
-def get_all_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+def get_all_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_read_db)):
     db_users = db.query(User).offset(skip).limit(limit).all()
     return db_users
 
@@ -26,17 +26,19 @@ def register_new_user(user: UserUpdate, db: Session = Depends(get_db)):
                             detail="The email password and username are not specified.")
 
     hashed_password = get_password_hash(user.password)
-    db_user = User(username=user.username, email=user.email, password=hashed_password, role=user.role)
-    db.add(db_user)
+    db_user = queries.insert_returning(db, User, username=user.username, email=user.email, password=hashed_password,
+                                       role=user.role or UserRole.READER)
+    response = UserResponse.model_validate(db_user)
+    event = events.publish(db, "user.registered", {"user_id": response.id, "role": response.role})
     db.commit()
-    db.refresh(db_user)
-    logging.info(f"Registered new user by admin, ID:{db_user.id}")
-    return db_user
+    events.dispatch(event)
+    logging.info(f"Registered new user by admin, ID:{response.id}")
+    return response
 
 
 @router.put("/admin/update_user/{user_id}", response_model=UserResponse)
 def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = db.scalars(queries.user_by_id, {"user_id": user_id}).first()
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
 
@@ -44,7 +46,29 @@ def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
     db_user.username = user.username
     db_user.password = get_password_hash(user.password)
     db_user.role = user.role
+    # the old tokens carry the old username and role
+    revoke_user_tokens(db, db_user.id)
+    event = events.publish(db, "user.updated", {"user_id": db_user.id, "role": db_user.role})
     db.commit()
+    events.dispatch(event)
     db.refresh(db_user)
     logging.info(f"Updated user by admin, ID:{db_user.id}")
     return db_user
+
+
+@router.post("/admin/users/{user_id}/revoke_tokens", response_model=dict)
+def revoke_tokens(user_id: int, db: Session = Depends(get_db)):
+    if not db.scalars(queries.user_by_id, {"user_id": user_id}).first():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+    revoke_user_tokens(db, user_id)
+    sessions.end_user_sessions(db, user_id)
+    db.commit()
+    logging.info(f"Revoked all tokens of user ID:{user_id}")
+    return {"detail": "Tokens revoked"}
+
+
+@router.get("/admin/replicas", response_model=list[dict])
+def get_replicas_health():
+    if replicas is None:
+        return []
+    return [{"replica": index, "healthy": healthy} for index, healthy in enumerate(replicas.check_health())]
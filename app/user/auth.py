@@ -1,9 +1,15 @@
+import logging
+
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app import queries, sessions
 from app.models import User, get_db, UserRole
+from app.ratelimit import login_limit
+from app.revocation import denylist, revoke_token
 from app.user.jwt import *
 
 router = APIRouter()
@@ -36,23 +42,35 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     username: str
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+def get_token_payload(token: str = Depends(oauth2_scheme)) -> dict:
+    payload = decode_token(token)
+    if not payload or denylist.is_revoked(payload.get("jti"), payload.get("id"), payload.get("iat")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+
+def get_current_user(payload: dict = Depends(get_token_payload)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    payload = decode_token(token)
-    if not payload:
-        raise credentials_exception
-
     user_id = payload.get("id")
     username = payload.get("username")
     role = payload.get("role")
@@ -65,25 +83,59 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == user.email).first():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-
     hashed_password = get_password_hash(user.password)
-    db_user = User(username=user.username, email=user.email, password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    # the unique email index does the check, no SELECT before the INSERT
+    try:
+        db_user = queries.insert_returning(db, User, username=user.username, email=user.email,
+                                           password=hashed_password)
+        response = UserResponse.model_validate(db_user)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+    return response
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(login_limit)])
 def login_user(user: UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = db.scalars(queries.user_by_email, {"email": user.email}).first()
     if not user.password or not db_user or not verify_password(user.password, db_user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    access_token = create_access_token(data={"id": db_user.id, "username": db_user.username, "role": db_user.role})
-    return Token(access_token=access_token)
+    session_id, refresh_token = sessions.start_session(db, db_user.id)
+    db.commit()
+    return issue_token(db_user, session_id, refresh_token)
+
+
+@router.post("/token/refresh", response_model=Token)
+def refresh_access_token(body: TokenRefresh, db: Session = Depends(get_db)):
+    rotated = sessions.rotate(db, body.refresh_token)
+    db.commit()
+    if rotated is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    session_id, user_id, refresh_token = rotated
+    # the claims are read again, a changed role or username is picked up on the next refresh
+    db_user = db.scalars(queries.user_by_id, {"user_id": user_id}).first()
+    return issue_token(db_user, session_id, refresh_token)
+
+
+def issue_token(db_user: User, session_id: int, refresh_token: str) -> Token:
+    access_token = create_access_token(data={"id": db_user.id, "username": db_user.username, "role": db_user.role,
+                                             "sid": session_id})
+    return Token(access_token=access_token, refresh_token=refresh_token)
+
+
+@router.post("/logout", response_model=dict)
+def logout_user(payload: dict = Depends(get_token_payload), db: Session = Depends(get_db)):
+    if not payload.get("jti"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token can't be revoked, log in again.")
+    revoke_token(db, payload["jti"], payload.get("id"), datetime.fromtimestamp(payload["exp"], timezone.utc)
+                 .replace(tzinfo=None))
+    if payload.get("sid"):
+        sessions.end_session(db, payload["sid"], payload.get("id"))
+    db.commit()
+    logging.info(f"User ID: {payload.get('id')} logged out")
+    return {"detail": "Logged out"}
 
 
 def check_admin(current_user: User = Depends(get_current_user)):
@@ -0,0 +1,159 @@
+# bulk registration of users by admin, e.g. a whole school at once
+import codecs
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import APIRouter, Depends, UploadFile
+from pydantic import BaseModel, EmailStr, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import events
+from app.models import User, UserRole, get_db
+from app.user.auth import check_admin
+from app.user.jwt import get_password_hash
+
+router = APIRouter(dependencies=[Depends(check_admin)])
+
+BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", os.cpu_count() or 1))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))
+
+_hash_pool = None
+EXTRA_FIELDS = "__extra__"
+
+
+class BulkUser(BaseModel):
+    username: str
+    email: EmailStr
+    password: str
+    role: UserRole = UserRole.READER
+
+
+class BulkFailure(BaseModel):
+    row: int
+    email: str | None = None
+    error: str
+
+
+class BulkResult(BaseModel):
+    created: int
+    failed: list[BulkFailure]
+
+
+def hash_pool() -> ProcessPoolExecutor:
+    """Processes hashing passwords, bcrypt holds the GIL so threads would not help."""
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn: forking a process that runs server threads can copy held locks
+        _hash_pool = ProcessPoolExecutor(max_workers=BULK_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown()
+        _hash_pool = None
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    if len(passwords) < 2 or BULK_HASH_WORKERS < 2:
+        return [get_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (BULK_HASH_WORKERS * 4))
+    return list(hash_pool().map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def read_rows(file: UploadFile):
+    """Yield (row number, dict) from a CSV with a header line or from NDJSON, without reading the whole file."""
+    lines = codecs.iterdecode(file.file, "utf-8-sig")
+    is_json = (file.content_type in ("application/x-ndjson", "application/json")
+               or (file.filename or "").endswith((".ndjson", ".jsonl")))
+    if is_json:
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, ValueError(f"Invalid JSON: {e}")
+                    continue
+                if not isinstance(data, dict):
+                    yield number, ValueError("Invalid JSON: expected an object")
+                    continue
+                yield number, data
+    else:
+        # the header is line 1, fields past the header end up under the restkey
+        for number, data in enumerate(csv.DictReader(lines, restkey=EXTRA_FIELDS), start=2):
+            if EXTRA_FIELDS in data:
+                yield number, ValueError("More fields than in the header")
+                continue
+            yield number, data
+
+
+def _insert(db: Session, rows: list[tuple[int, dict]], failed: list[BulkFailure]) -> int:
+    """Insert a batch, falling back to single rows to find the ones a concurrent registration took."""
+    try:
+        db.execute(insert(User), [values for _, values in rows])
+        db.commit()
+        return len(rows)
+    except IntegrityError:
+        db.rollback()
+    created = 0
+    for number, values in rows:
+        try:
+            db.execute(insert(User), [values])
+            db.commit()
+            created += 1
+        except IntegrityError:
+            db.rollback()
+            failed.append(BulkFailure(row=number, email=values["email"], error="Email already registered"))
+    return created
+
+
+@router.post("/admin/register_bulk", response_model=BulkResult)
+def register_bulk(file: UploadFile, db: Session = Depends(get_db)):
+    users, failed, seen = [], [], set()
+    for number, data in read_rows(file):
+        if isinstance(data, Exception):
+            failed.append(BulkFailure(row=number, error=str(data)))
+            continue
+        email = data.get("email") if isinstance(data.get("email"), str) else None
+        try:
+            user = BulkUser(**{key: value for key, value in data.items() if value not in (None, "")})
+        except ValidationError as e:
+            failed.append(BulkFailure(row=number, email=email,
+                                      error="; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                                                      for err in e.errors())))
+            continue
+        except TypeError as e:
+            failed.append(BulkFailure(row=number, email=email, error=str(e)))
+            continue
+        if user.email in seen:
+            failed.append(BulkFailure(row=number, email=user.email, error="Duplicate email in file"))
+            continue
+        seen.add(user.email)
+        users.append((number, user))
+
+    existing = set(db.scalars(select(User.email).where(User.email.in_(seen)))) if seen else set()
+    for number, user in users:
+        if user.email in existing:
+            failed.append(BulkFailure(row=number, email=user.email, error="Email already registered"))
+    users = [(number, user) for number, user in users if user.email not in existing]
+
+    hashes = hash_passwords([user.password for _, user in users])
+    rows = [(number, {"username": user.username, "email": user.email, "password": hashed, "role": user.role})
+            for (number, user), hashed in zip(users, hashes)]
+    created = 0
+    for start in range(0, len(rows), BULK_BATCH_SIZE):
+        created += _insert(db, rows[start:start + BULK_BATCH_SIZE], failed)
+
+    if created:
+        event = events.publish(db, "users.registered_bulk", {"created": created, "failed": len(failed)})
+        db.commit()
+        events.dispatch(event)
+    logging.info(f"Registered {created} users in bulk by admin, {len(failed)} rows failed")
+    return BulkResult(created=created, failed=sorted(failed, key=lambda failure: failure.row))
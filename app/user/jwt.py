@@ -1,12 +1,13 @@
 import os
+import uuid
 from datetime import timedelta, datetime, timezone
 from typing import Optional
 
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from dotenv import load_dotenv
 
-load_dotenv()
+from app import config  # noqa: F401 (loads .env)
+from app import tracing
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
@@ -21,22 +22,31 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti names the token in the revocation denylist, iat is compared with the user's revocation cutoff
+    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc).timestamp(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    with tracing.span("auth.verify_password"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 
+def warm_up_crypto():
+    """Load the bcrypt backend and the jose algorithms, which are otherwise loaded by the first request."""
+    pwd_context.handler("bcrypt").get_backend()
+    decode_token(create_access_token({"warm_up": True}, timedelta(minutes=1)))
+
+
 def decode_token(token: str) -> Optional[dict]:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        return None
+    with tracing.span("auth.decode_token"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            return payload
+        except JWTError:
+            return None
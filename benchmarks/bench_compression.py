@@ -0,0 +1,74 @@
+# Bandwidth vs CPU of compressing /book/get pages with embedded authors and loans.
+# python -m benchmarks.bench_compression [books per page]
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# app.models needs a url at import
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/bench.db")
+
+from pydantic import TypeAdapter
+
+from app.book.books import AuthorResponse, BookResponse, LoanResponse
+from app.compression import ENCODERS, BrotliEncoder, GzipEncoder
+
+# link speeds in Mbit/s the transfer time is estimated for
+LINKS = {"10 Mbit/s": 10, "100 Mbit/s": 100}
+STREAM_CHUNK = 4096
+
+
+def page(size: int) -> bytes:
+    authors = [AuthorResponse(id=i, name=f"Author {i}", bio="Wrote novels and short stories.", bday=date(1900, 1, 1))
+               for i in range(1, 11)]
+    books = [BookResponse(id=i, title=f"Book {i}", description=f"Description of book {i}. " * 3,
+                          publication=date(2000, 1, 1) + timedelta(days=i), authors=authors[i % 9:i % 9 + 2],
+                          style="novel", copies=5,
+                          loans=[LoanResponse(id=i * 10 + j, user_id=j + 1, book_id=i, loan_date=date(2024, 1, 1),
+                                              return_date=date(2024, 1, 21)) for j in range(i % 4)])
+             for i in range(1, size + 1)]
+    return TypeAdapter(list[BookResponse]).dump_json(books)
+
+
+def measure(make_encoder, body: bytes, stream: bool, repeat: int = 5) -> tuple[int, float]:
+    """Return the compressed size and the best milliseconds spent compressing."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encoder = make_encoder()
+        if stream:
+            data = b"".join(encoder.compress(body[i:i + STREAM_CHUNK], flush=True)
+                            for i in range(0, len(body), STREAM_CHUNK)) + encoder.finish()
+        else:
+            data = encoder.compress(body) + encoder.finish()
+        best = min(best, time.perf_counter() - started)
+    return len(data), best * 1000
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    body = page(size)
+    cases = [(f"gzip-{level}", lambda level=level: GzipEncoder(level), False) for level in (1, 6, 9)]
+    cases.append(("gzip-6 stream", lambda: GzipEncoder(6), True))
+    if "br" in ENCODERS:
+        cases += [(f"br-{quality}", lambda quality=quality: BrotliEncoder(quality), False) for quality in (1, 4, 11)]
+        cases.append(("br-4 stream", lambda: BrotliEncoder(4), True))
+    else:
+        print("brotli is not installed, pip install brotli to compare it")
+
+    print(f"page of {size} books, {len(body) / 1024:.0f} KiB of JSON")
+    print(f"{'encoding':<15}{'KiB':>8}{'ratio':>8}{'cpu ms':>9}{'MB/s':>8}"
+          + "".join(f"{'ms @ ' + link:>18}" for link in LINKS))
+    rows = [("identity", len(body), 0.0)]
+    rows += [(name, *measure(make_encoder, body, stream)) for name, make_encoder, stream in cases]
+    for name, compressed, cpu_ms in rows:
+        speed = f"{len(body) / 1000 / cpu_ms:>8.0f}" if cpu_ms else f"{'-':>8}"
+        # what the client waits for: compressing plus sending the result
+        totals = [cpu_ms + compressed * 8 / (mbit * 1000) for mbit in LINKS.values()]
+        print(f"{name:<15}{compressed / 1024:>8.0f}{len(body) / compressed:>8.1f}{cpu_ms:>9.2f}{speed}"
+              + "".join(f"{total:>18.1f}" for total in totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Python-side cost of the hot lookups: legacy db.query() rebuilt per request vs the prebuilt statements in app.queries.
+# python -m benchmarks.bench_queries [iterations]
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+# app.models needs a url at import, the benchmark itself runs on its own in-memory database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/bench.db")
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import queries
+from app.models import Author, Base, Book, Loan, User
+
+engine = create_engine("sqlite://", poolclass=StaticPool)
+Base.metadata.create_all(bind=engine)
+Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed():
+    with Session() as db:
+        authors = [Author(name=f"Author {i}", bio="bio", bday=date(1900, 1, 1)) for i in range(10)]
+        db.add_all(authors)
+        db.add_all(Book(title=f"Book {i}", description="", publication=date(2000, 1, 1), style="novel", copies=5,
+                        authors=authors[:2]) for i in range(100))
+        db.add_all(User(username=f"user{i}", email=f"user{i}@test.ru", password="x") for i in range(100))
+        db.flush()
+        db.add_all(Loan(user_id=i % 100 + 1, book_id=i % 100 + 1, loan_date=date.today(), return_date=date.today())
+                   for i in range(300))
+        db.commit()
+
+
+CASES = {
+    "Book.id == ?": (
+        lambda db, i: db.query(Book).filter(Book.id == i % 100 + 1).first(),
+        lambda db, i: db.scalars(queries.book_by_id, {"book_id": i % 100 + 1}).first(),
+    ),
+    "Author.id.in_(...)": (
+        lambda db, i: db.query(Author).filter(Author.id.in_([i % 10 + 1, 1, 2])).all(),
+        lambda db, i: db.scalars(queries.authors_by_ids, {"author_ids": [i % 10 + 1, 1, 2]}).all(),
+    ),
+    "count(Loan.user_id == ?)": (
+        lambda db, i: db.query(func.count(Loan.id)).filter(Loan.user_id == i % 100 + 1).scalar(),
+        lambda db, i: db.scalar(queries.loan_count_by_user, {"user_id": i % 100 + 1}),
+    ),
+    "User.email == ?": (
+        lambda db, i: db.query(User).filter(User.email == f"user{i % 100}@test.ru").first(),
+        lambda db, i: db.scalars(queries.user_by_email, {"email": f"user{i % 100}@test.ru"}).first(),
+    ),
+}
+
+
+def measure(fn, iterations: int) -> float:
+    with Session() as db:
+        for i in range(100):
+            fn(db, i)
+        started = time.perf_counter()
+        for i in range(iterations):
+            fn(db, i)
+            db.expunge_all()
+        return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    seed()
+    print(f"{'query':<26}{'db.query() us':>15}{'cached us':>12}{'saved':>8}")
+    for name, (legacy, cached) in CASES.items():
+        legacy_us = measure(legacy, iterations)
+        cached_us = measure(cached, iterations)
+        print(f"{name:<26}{legacy_us:>15.1f}{cached_us:>12.1f}{1 - cached_us / legacy_us:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+
+# app.models creates its engine at import, so the app's own sessions (lifespan, event worker,
+# background jobs) use the same database file as the test modules
+os.environ["DATABASE_URL"] = "sqlite:///./test.db"
+os.environ.setdefault("SECRET_KEY", "HASAN2008")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
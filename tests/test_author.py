@@ -6,7 +6,8 @@ from sqlalchemy.orm import sessionmaker
 
 
 from app.author.authors import router, get_db
-from app.models import Base
+from app.book.books import router as book_router
+from app.models import Base, get_read_db
 from app.user.jwt import *
 
 DATABASE_URL = "sqlite:///./test.db"
@@ -19,6 +20,7 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 
 app = FastAPI()
 app.include_router(router)
+app.include_router(book_router)
 
 
 def override_get_db():
@@ -30,6 +32,7 @@ def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 def create_jwt_token(role: str):
@@ -138,6 +141,9 @@ def test_get_authors(test_client):
     response_get_all = test_client.get(
         "/author/get"
     )
+    response_get_all_stream = test_client.get(
+        "/author/get?stream=true"
+    )
     response_get_by_id = test_client.get(
         "/author/get/1"
     )
@@ -145,11 +151,60 @@ def test_get_authors(test_client):
         "/author/get/100"
     )
 
-    assert response_get_all.json() == [create1_author.json(), create2_author.json()]
-    assert response_get_by_id.json() == create1_author.json()
+    assert response_get_all.json() == [{**create1_author.json(), "book_count": 0},
+                                       {**create2_author.json(), "book_count": 0}]
+    assert response_get_all_stream.json() == response_get_all.json()
+    assert response_get_by_id.json() == {**create1_author.json(), "book_count": 0}
     assert response_get_non_exists.status_code == 404
 
 
+def test_get_author_with_books(test_client):
+    token = create_jwt_token(role="admin")
+
+    author_data = {
+        "name": "Test Author",
+        "bio": "This is a test bio.",
+        "bday": "1000-01-01"
+    }
+    book_data = {
+        "title": "Test book",
+        "description": "Test description book",
+        "publication": "1000-01-01",
+        "authors": [1],
+        "style": "bok",
+        "copies": 5
+    }
+    for _ in range(2):
+        test_client.post(
+            "/author/create",
+            json=author_data,
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        test_client.post(
+            "/book/create",
+            json=book_data,
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    response_get_all = test_client.get(
+        "/author/get"
+    )
+    response_with_books = test_client.get(
+        "/author/get/1?include=books"
+    )
+    response_without_books = test_client.get(
+        "/author/get/2?include=books"
+    )
+
+    assert [author["book_count"] for author in response_get_all.json()] == [2, 0]
+    assert response_with_books.status_code == 200
+    assert response_with_books.json()["book_count"] == 2
+    assert [book["id"] for book in response_with_books.json()["books"]] == [1, 2]
+    assert response_with_books.json()["books"][0]["title"] == book_data["title"]
+    assert response_without_books.json()["book_count"] == 0
+    assert response_without_books.json()["books"] == []
+
+
 def test_update_author(test_client):
     token = create_jwt_token(role="admin")
     non_admin_token = create_jwt_token(role="reader")
@@ -223,3 +278,32 @@ def test_delete_author(test_client):
     assert response.json()["ID"] == "1"
     assert response_delete_non_exists.status_code == 404
     assert response_delete_non_admin.status_code == 403
+
+
+def test_delete_authors_bulk(test_client):
+    token = create_jwt_token(role="admin")
+    for i in range(3):
+        test_client.post(
+            "/author/create",
+            json={"name": f"Test Author {i + 1}", "bio": "This is a test bio.", "bday": "1000-01-01"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    test_client.post(
+        "/book/create",
+        json={"title": "Test book", "description": "Test description book", "publication": "1000-01-01",
+              "authors": [1, 2], "style": "bok", "copies": 5},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    response = test_client.post(
+        "/admin/authors/delete",
+        json={"ids": [1, 3, 100]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_book = test_client.get("/book/get/1")
+    response_authors = test_client.get("/author/get")
+
+    assert response.status_code == 200, response.json()
+    assert response.json() == {"deleted": [1, 3], "not_found": [100]}
+    assert [author["id"] for author in response_book.json()["authors"]] == [2]
+    assert [author["id"] for author in response_authors.json()] == [2]
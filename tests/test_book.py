@@ -1,12 +1,12 @@
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from app.book.books import router as book_router, get_db
 from app.author.authors import router as author_router
-from app.models import Base
+from app.models import Base, get_read_db
 from app.user.jwt import *
 
 DATABASE_URL = "sqlite:///./test.db"
@@ -31,6 +31,7 @@ def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 def create_jwt_token(role: str):
@@ -173,6 +174,35 @@ def test_get_books(test_client):
     assert response_get_non_exists.status_code == 404
 
 
+def test_get_books_stream(test_client, monkeypatch):
+    from app.book import books
+
+    monkeypatch.setattr(books, "STREAM_BATCH_SIZE", 2)
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/author/create",
+        json={"name": "Test Author", "bio": "This is a test bio.", "bday": "1000-01-01"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    for i in range(5):
+        test_client.post(
+            "/book/create",
+            json={"title": f"Test book {i}", "description": "Test description book", "publication": "1000-01-01",
+                  "authors": [1], "style": "bok", "copies": 5},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    response_list = test_client.get("/book/get?skip=1&limit=10")
+    response_stream = test_client.get("/book/get?skip=1&limit=10&stream=true")
+    response_empty = test_client.get("/book/get?skip=10&stream=true")
+
+    assert response_stream.status_code == 200
+    assert response_stream.headers["Content-Type"] == "application/json"
+    assert response_stream.json() == response_list.json()
+    assert len(response_stream.json()) == 4
+    assert response_empty.json() == []
+
+
 def test_update_book(test_client):
     token = create_jwt_token(role="admin")
     author_data = {
@@ -230,6 +260,55 @@ def test_update_book(test_client):
     assert response_update_non_exists.status_code == 404
 
 
+def test_patch_book_authors(test_client):
+    token = create_jwt_token(role="admin")
+    for i in range(3):
+        test_client.post(
+            "/author/create",
+            json={"name": f"Test Author {i + 1}", "bio": "This is a test bio.", "bday": "1000-01-01"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    test_client.post(
+        "/book/create",
+        json={"title": "Test book", "description": "Test description book", "publication": "1000-01-01",
+              "authors": [1, 2], "style": "bok", "copies": 5},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "book_authors" in statement and not statement.startswith("SELECT"):
+            statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", record)
+    response_patch = test_client.patch(
+        "/book/update/1",
+        json={"authors": [2, 3]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    event.remove(engine, "before_cursor_execute", record)
+    response_title = test_client.patch(
+        "/book/update/1",
+        json={"title": "New title", "copies": None},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_missing_author = test_client.patch(
+        "/book/update/1",
+        json={"authors": [3, 100]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_book = test_client.get("/book/get/1")
+
+    assert response_patch.status_code == 200, response_patch.json()
+    assert sorted(author["id"] for author in response_patch.json()["authors"]) == [2, 3]
+    # author 2 stays as it is, only author 1 is removed and author 3 added
+    assert statements == ["DELETE", "INSERT"]
+    assert response_title.json()["title"] == "New title"
+    assert response_title.json()["copies"] == 5
+    assert response_missing_author.status_code == 400
+    assert sorted(author["id"] for author in response_book.json()["authors"]) == [2, 3]
+
+
 def test_delete_book(test_client):
     token = create_jwt_token(role="admin")
     reader = create_jwt_token(role="reader")
@@ -273,3 +352,31 @@ def test_delete_book(test_client):
     assert response_delete.json() == {"detail": "Delete book", "ID": "1"}
     assert response_delete_non_exists.status_code == 404
     assert response_delete_non_admin.status_code == 403
+
+
+def test_create_book_idempotency_key(test_client):
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/author/create",
+        json={"name": "Test Author", "bio": "This is a test bio.", "bday": "1000-01-01"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    book_data = {
+        "title": "Test book",
+        "description": "Test description book",
+        "publication": "1000-01-01",
+        "authors": [1],
+        "style": "bok",
+        "copies": 5
+    }
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "create-1"}
+
+    response_first = test_client.post("/book/create", json=book_data, headers=headers)
+    response_retry = test_client.post("/book/create", json=book_data, headers=headers)
+    response_other_body = test_client.post("/book/create", json={**book_data, "title": "Other"}, headers=headers)
+    response_get_all = test_client.get("/book/get")
+
+    assert response_first.status_code == 200, response_first.json()
+    assert response_retry.json() == response_first.json()
+    assert response_other_body.status_code == 422
+    assert len(response_get_all.json()) == 1
@@ -0,0 +1,150 @@
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import ratelimit
+from app.book.books import router as book_router
+from app.book.loan_books import router as loans_router
+from app.branch.branches import router as branch_router
+from app.models import Author, Base, Book, BranchInventory, User, get_db, get_read_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+
+
+@event.listens_for(engine, "connect")
+def enable_foreign_keys(connection, record):
+    connection.execute("PRAGMA foreign_keys=ON")
+
+
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(book_router)
+app.include_router(loans_router)
+app.include_router(branch_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+
+def create_jwt_token(role: str, u_id: int = 1):
+    token = create_access_token(data={"id": u_id, "username": "testUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ratelimit.backend.reset()
+    with TestingSessionLocal() as db:
+        db.add(User(id=1, username="testUser", email="test@test.ru", password="x"))
+        db.add(Author(id=1, name="Author", bio="Bio", bday=date(1900, 1, 1)))
+        for book_id in (1, 2):
+            db.add(Book(id=book_id, title=f"Book {book_id}", description="Text", publication=date(2000, 1, 1),
+                        style="Novel", copies=0))
+        db.commit()
+
+
+@pytest.fixture(scope="function")
+def create_branches(test_client):
+    admin = {"Authorization": f"Bearer {create_jwt_token('admin')}"}
+    for name in ("Central", "North"):
+        test_client.post("/admin/branches", json={"name": name}, headers=admin)
+    # book 1 is on the shelf of Central only
+    test_client.put("/admin/branches/1/books/1", json={"copies": 1}, headers=admin)
+    test_client.put("/admin/branches/2/books/1", json={"copies": 0}, headers=admin)
+    yield admin
+
+
+def branch_copies(book_id: int, branch_id: int) -> int:
+    with TestingSessionLocal() as db:
+        return db.get(BranchInventory, (book_id, branch_id)).copies
+
+
+def test_create_branch(test_client, create_branches):
+    response_duplicate = test_client.post("/admin/branches", json={"name": "Central"}, headers=create_branches)
+    response_non_admin = test_client.post(
+        "/admin/branches",
+        json={"name": "South"},
+        headers={"Authorization": f"Bearer {create_jwt_token('reader')}"}
+    )
+    response_unknown_book = test_client.put("/admin/branches/1/books/100", json={"copies": 1},
+                                            headers=create_branches)
+
+    assert [branch["name"] for branch in test_client.get("/branch/get").json()] == ["Central", "North"]
+    assert response_duplicate.status_code == 409
+    assert response_non_admin.status_code == 403
+    assert response_unknown_book.status_code == 404
+
+
+def test_take_and_return_at_branches(test_client, create_branches):
+    reader = {"Authorization": f"Bearer {create_jwt_token('reader')}"}
+
+    response_catalog = test_client.get("/book/get?branch_id=1")
+    response_north = test_client.post("/book/take/1?branch_id=2", headers=reader)
+    response_unknown_branch = test_client.post("/book/take/1?branch_id=100", headers=reader)
+    response_take = test_client.post("/book/take/1?branch_id=1", headers=reader)
+    response_catalog_after = test_client.get("/book/get?branch_id=1")
+    copies_after_take = branch_copies(1, 1)
+    # returned at another branch, the copy stays there
+    response_return = test_client.delete("/book/return/1?branch_id=2", headers=reader)
+    response_availability = test_client.get("/book/get/1/branches")
+
+    assert [book["id"] for book in response_catalog.json()] == [1]
+    assert response_north.status_code == 403
+    assert response_north.json() == {"detail": "Not enough copies of books."}
+    assert response_unknown_branch.status_code == 404
+    assert response_take.status_code == 200, response_take.json()
+    assert response_take.json()["branch_id"] == 1
+    # the copies without a branch are not touched
+    assert response_take.json()["book"]["copies"] == 0
+    assert response_catalog_after.json() == []
+    assert copies_after_take == 0
+    assert response_return.status_code == 200
+    assert response_availability.json() == [{"branch_id": 2, "name": "North", "copies": 1}]
+
+
+def test_return_to_branch_of_loan(test_client, create_branches):
+    reader = {"Authorization": f"Bearer {create_jwt_token('reader')}"}
+    test_client.post("/book/take/1?branch_id=1", headers=reader)
+
+    test_client.delete("/book/return/1", headers=reader)
+
+    assert branch_copies(1, 1) == 1
+    with TestingSessionLocal() as db:
+        assert db.get(Book, 1).copies == 0
+
+
+def test_reserve_book_available_at_branch(test_client, create_branches):
+    reader = {"Authorization": f"Bearer {create_jwt_token('reader')}"}
+
+    response_available = test_client.post("/book/reserve/1", headers=reader)
+    response_not_available = test_client.post("/book/reserve/2", headers=reader)
+
+    assert response_available.status_code == 409
+    assert response_not_available.status_code == 201
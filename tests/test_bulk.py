@@ -0,0 +1,142 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.user import bulk
+from app.user.auth import router as auth_router
+from app.user.bulk import router as bulk_router, get_db
+from app.models import Base
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(auth_router)
+app.include_router(bulk_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def create_jwt_token(role: str):
+    token = create_access_token(data={"id": 1, "username": "testUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+    bulk.shutdown_hash_pool()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def test_register_bulk_csv(test_client, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_HASH_WORKERS", 2)
+    monkeypatch.setattr(bulk, "BULK_BATCH_SIZE", 2)
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/register",
+        json={"username": "Existing", "email": "taken@test.ru", "password": "test"}
+    )
+    csv_file = ("username,email,password,role\n"
+                "User1,user1@test.ru,pass1,\n"
+                "User2,user2@test.ru,pass2,admin\n"
+                "User3,not-an-email,pass3,\n"
+                "User4,taken@test.ru,pass4,\n"
+                "User5,user1@test.ru,pass5,\n"
+                "User6,user6@test.ru,pass6,reader\n")
+
+    response = test_client.post(
+        "/admin/register_bulk",
+        files={"file": ("users.csv", csv_file, "text/csv")},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_login = test_client.post(
+        "/login",
+        json={"email": "user6@test.ru", "password": "pass6"}
+    )
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["created"] == 3
+    assert [(failure["row"], failure["email"]) for failure in response.json()["failed"]] == [
+        (4, "not-an-email"), (5, "taken@test.ru"), (6, "user1@test.ru")]
+    assert response_login.status_code == 200
+
+
+def test_register_bulk_ndjson(test_client):
+    token = create_jwt_token(role="admin")
+    reader = create_jwt_token(role="reader")
+    ndjson_file = "\n".join([
+        json.dumps({"username": "User1", "email": "user1@test.ru", "password": "pass1"}),
+        "{broken",
+        json.dumps({"username": "User2", "email": "user2@test.ru"}),
+    ])
+
+    response = test_client.post(
+        "/admin/register_bulk",
+        files={"file": ("users.ndjson", ndjson_file, "application/x-ndjson")},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_non_admin = test_client.post(
+        "/admin/register_bulk",
+        files={"file": ("users.ndjson", ndjson_file, "application/x-ndjson")},
+        headers={"Authorization": f"Bearer {reader}"}
+    )
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["created"] == 1
+    assert [failure["row"] for failure in response.json()["failed"]] == [2, 3]
+    assert response.json()["failed"][1]["error"] == "password: Field required"
+    assert response_non_admin.status_code == 403
+
+
+def test_register_bulk_malformed_rows(test_client):
+    token = create_jwt_token(role="admin")
+    csv_file = ("username,email,password\n"
+                "User1,user1@test.ru,pass1,extra\n"
+                "User2,user2@test.ru,pass2\n")
+    ndjson_file = "\n".join([
+        "[1, 2]",
+        json.dumps({"username": "User3", "email": "user3@test.ru", "password": "pass3"}),
+    ])
+
+    response_csv = test_client.post(
+        "/admin/register_bulk",
+        files={"file": ("users.csv", csv_file, "text/csv")},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response_ndjson = test_client.post(
+        "/admin/register_bulk",
+        files={"file": ("users.ndjson", ndjson_file, "application/x-ndjson")},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response_csv.status_code == 200, response_csv.json()
+    assert response_csv.json() == {"created": 1, "failed": [
+        {"row": 2, "email": None, "error": "More fields than in the header"}]}
+    assert response_ndjson.status_code == 200, response_ndjson.json()
+    assert response_ndjson.json() == {"created": 1, "failed": [
+        {"row": 1, "email": None, "error": "Invalid JSON: expected an object"}]}
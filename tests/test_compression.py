@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compression import CompressionMiddleware, choose_encoding
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+ITEMS = [{"id": i, "title": f"Book {i}", "style": "novel"} for i in range(100)]
+
+
+@app.get("/large")
+def large():
+    return ITEMS
+
+
+@app.get("/small")
+def small():
+    return {"detail": "ok"}
+
+
+@app.get("/image")
+def image():
+    return Response(b"\x89PNG" + b"\x00" * 2000, media_type="image/png")
+
+
+@app.get("/export")
+def export():
+    def rows():
+        for item in ITEMS:
+            yield json.dumps(item) + "\n"
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+def test_large_json_is_gzipped(test_client):
+    response = test_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    raw = test_client.get("/large", headers={"Accept-Encoding": "identity"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(raw.content)
+    assert response.json() == ITEMS
+    assert "Content-Encoding" not in raw.headers
+
+
+def test_small_and_other_types_are_not_compressed(test_client):
+    response_small = test_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    response_image = test_client.get("/image", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response_small.headers
+    assert "Content-Encoding" not in response_image.headers
+    assert len(response_image.content) == 2004
+
+
+def test_stream_is_compressed_chunk_by_chunk():
+    messages = []
+
+    async def receive():
+        # the client stays connected until the response ends
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/export", "raw_path": b"/export", "query_string": b"",
+             "root_path": "", "scheme": "http", "server": ("test", 80), "http_version": "1.1",
+             "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(app(scope, receive, send))
+
+    start, *chunks = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # every chunk is flushed, so the client can decode each one as it arrives
+    decompressor = zlib.decompressobj(31)
+    assert json.loads(decompressor.decompress(chunks[0]["body"])) == ITEMS[0]
+    body = b"".join(chunk["body"] for chunk in chunks)
+    assert [json.loads(line) for line in gzip.decompress(body).decode().splitlines()] == ITEMS
+
+
+def test_brotli_preferred():
+    pytest.importorskip("brotli")
+    client = TestClient(app)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.json() == ITEMS
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip;q=0, deflate", ["gzip"]) is None
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("", ["gzip"]) is None
@@ -0,0 +1,157 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import events
+from app.book.books import router as book_router
+from app.author.authors import router as author_router
+from app.user.auth import router as auth_router
+from app.book.loan_books import router as loans_router, get_db
+from app.models import Base, OutboxEvent
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(book_router)
+app.include_router(author_router)
+app.include_router(auth_router)
+app.include_router(loans_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def create_jwt_token(role: str, u_id: Optional[int] = 1):
+    token = create_access_token(data={"id": u_id, "username": "TestUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def received():
+    received = []
+
+    def handler(db, topic, payload):
+        received.append((topic, payload))
+
+    events.handlers["loan.taken"].append(handler)
+    events.handlers["loan.returned"].append(handler)
+    yield received
+    events.handlers["loan.taken"].remove(handler)
+    events.handlers["loan.returned"].remove(handler)
+
+
+@pytest.fixture(scope="function")
+def create_depends(test_client):
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/author/create",
+        json={"name": "Test Author", "bio": "This is a test bio.", "bday": "1000-01-01"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    test_client.post(
+        "/book/create",
+        json={"title": "Test book", "description": "Test description book", "publication": "1000-01-01",
+              "authors": [1], "style": "bok", "copies": 5},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    test_client.post(
+        "/register",
+        json={"username": "TestUser", "email": "test@test.ru", "password": "test"}
+    )
+    yield
+
+
+def test_loan_events_written_to_outbox(test_client, create_depends, received):
+    user = create_jwt_token(u_id=1, role="reader")
+    test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user}"}
+    )
+    test_client.delete(
+        "/book/return/1",
+        headers={"Authorization": f"Bearer {user}"}
+    )
+
+    with TestingSessionLocal() as db:
+        outbox = db.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    assert [event.topic for event in outbox] == ["loan.taken", "loan.returned"]
+    assert json.loads(outbox[0].payload)["book_id"] == 1
+    assert all(event.processed_at is None for event in outbox)
+    # the worker is not running, nothing was delivered inline
+    assert received == []
+
+
+def test_worker_drains_outbox(test_client, create_depends, received):
+    user = create_jwt_token(u_id=1, role="reader")
+    test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user}"}
+    )
+    worker = events.EventWorker(TestingSessionLocal, batch_size=1, poll_seconds=0.1)
+    worker.start()
+    with TestingSessionLocal() as db:
+        event = events.publish(db, "loan.returned", {"loan_id": 1, "user_id": 1, "book_id": 1})
+        db.commit()
+        worker.notify(event.id)
+    worker.stop()
+
+    with TestingSessionLocal() as db:
+        pending = db.query(OutboxEvent).filter(OutboxEvent.processed_at.is_(None)).count()
+    assert pending == 0
+    assert [topic for topic, _ in received] == ["loan.taken", "loan.returned"]
+    assert received[0][1]["user_id"] == 1
+
+
+def test_failed_event_is_retried():
+    calls = []
+
+    def flaky(db, topic, payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise RuntimeError("handler failed")
+
+    events.handlers["test.flaky"].append(flaky)
+    with TestingSessionLocal() as db:
+        event = events.publish(db, "test.flaky", {"n": 1})
+        db.commit()
+        event_id = event.id
+    worker = events.EventWorker(TestingSessionLocal)
+    worker.poll()
+    worker.poll()
+    events.handlers["test.flaky"].remove(flaky)
+
+    with TestingSessionLocal() as db:
+        event = db.get(OutboxEvent, event_id)
+        assert event.processed_at is not None
+        assert event.attempts == 1
+    assert len(calls) == 2
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import os
+import struct
+import zlib
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import storage
+from app.book.files import router as files_router
+from app.models import Base, Book, BookFile, get_db, get_read_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(files_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+
+def png(red: int, green: int, blue: int) -> bytes:
+    """A 1x1 PNG, built by hand so the tests run without Pillow."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(bytes([0, red, green, blue]))) + chunk(b"IEND", b""))
+
+
+COVER = png(255, 0, 0)
+
+
+def create_jwt_token(role: str):
+    token = create_access_token(data={"id": 1, "username": "testUser", "role": role})
+    return token
+
+
+def admin(content_type: str) -> dict:
+    return {"Authorization": f"Bearer {create_jwt_token('admin')}", "Content-Type": content_type}
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown(tmp_path, monkeypatch):
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(storage, "STORAGE_DIR", str(tmp_path))
+    with TestingSessionLocal() as db:
+        db.add(Book(id=1, title="Book", description="Text", publication=date(2000, 1, 1), style="Novel", copies=1))
+        db.commit()
+
+
+def blobs(tmp_path) -> list[str]:
+    return [name for _, _, names in os.walk(tmp_path / "blobs") for name in names]
+
+
+def test_upload_cover(test_client, tmp_path):
+    response = test_client.put("/book/1/cover", content=COVER, headers=admin("image/png"))
+    response_replaced = test_client.put("/book/1/cover", content=png(0, 0, 255), headers=admin("image/png"))
+    response_files = test_client.get("/book/1/files")
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["sha256"] == hashlib.sha256(COVER).hexdigest()
+    assert response.json()["size"] == len(COVER)
+    assert response_replaced.status_code == 200
+    # a book has one cover, the old blob stays in the storage
+    assert [file["sha256"] for file in response_files.json()] == [response_replaced.json()["sha256"]]
+    assert len(blobs(tmp_path)) == 2
+    # nothing is left from the streamed uploads
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_same_content_is_stored_once(test_client, tmp_path):
+    test_client.put("/book/1/cover", content=COVER, headers=admin("image/png"))
+    response = test_client.post("/book/1/attachments?filename=scan.pdf", content=COVER,
+                                headers=admin("application/pdf"))
+
+    assert response.status_code == 201
+    assert len(test_client.get("/book/1/files").json()) == 2
+    assert blobs(tmp_path) == [hashlib.sha256(COVER).hexdigest()[2:]]
+
+
+def test_upload_rejected(test_client, monkeypatch):
+    response_type = test_client.put("/book/1/cover", content=b"%PDF", headers=admin("application/pdf"))
+    response_no_book = test_client.put("/book/100/cover", content=COVER, headers=admin("image/png"))
+    response_empty = test_client.put("/book/1/cover", content=b"", headers=admin("image/png"))
+    response_non_admin = test_client.put(
+        "/book/1/cover",
+        content=COVER,
+        headers={"Authorization": f"Bearer {create_jwt_token('reader')}", "Content-Type": "image/png"}
+    )
+    monkeypatch.setattr(storage, "MAX_UPLOAD_BYTES", 10)
+    response_too_large = test_client.put("/book/1/cover", content=COVER, headers=admin("image/png"))
+
+    assert response_type.status_code == 415
+    assert response_no_book.status_code == 404
+    assert response_empty.status_code == 400
+    assert response_non_admin.status_code == 403
+    assert response_too_large.status_code == 413
+    assert test_client.get("/book/1/files").json() == []
+
+
+def test_streamed_upload_too_large(tmp_path):
+    async def chunks():
+        for _ in range(4):
+            yield b"x" * 4
+
+    with pytest.raises(storage.UploadTooLarge):
+        asyncio.run(storage.save_stream(chunks(), 10))
+
+    assert blobs(tmp_path) == []
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_get_cover(test_client):
+    test_client.put("/book/1/cover", content=COVER, headers=admin("image/png"))
+    etag = f'"{hashlib.sha256(COVER).hexdigest()}"'
+
+    response = test_client.get("/book/1/cover")
+    response_not_modified = test_client.get("/book/1/cover", headers={"If-None-Match": etag})
+    response_range = test_client.get("/book/1/cover", headers={"Range": "bytes=0-7"})
+    response_no_cover = test_client.get("/book/100/cover")
+
+    assert response.status_code == 200
+    assert response.content == COVER
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    assert response_not_modified.status_code == 304
+    assert response_not_modified.content == b""
+    assert response_range.status_code == 206
+    assert response_range.content == COVER[:8]
+    assert response_range.headers["content-range"] == f"bytes 0-7/{len(COVER)}"
+    assert response_no_cover.status_code == 404
+
+
+def test_get_attachment(test_client):
+    file_id = test_client.post("/book/1/attachments?filename=../notes/scan.pdf", content=b"%PDF-1.4",
+                               headers=admin("application/pdf")).json()["id"]
+
+    response = test_client.get(f"/book/1/attachments/{file_id}")
+    response_other_book = test_client.get(f"/book/2/attachments/{file_id}")
+
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.4"
+    # the path of the uploaded name is dropped
+    assert response.headers["content-disposition"] == 'attachment; filename="scan.pdf"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response_other_book.status_code == 404
+
+
+def test_cover_thumbnail_sizes(test_client):
+    response = test_client.get("/book/1/cover/thumbnail?size=300")
+
+    assert response.status_code == 400
+
+
+def test_cover_thumbnail_without_pillow(test_client, monkeypatch):
+    test_client.put("/book/1/cover", content=COVER, headers=admin("image/png"))
+    monkeypatch.setattr(storage, "Image", None)
+
+    response = test_client.get("/book/1/cover/thumbnail?size=128")
+
+    assert response.status_code == 501
+
+
+@pytest.mark.skipif(storage.Image is None, reason="needs Pillow")
+def test_cover_thumbnail(test_client):
+    import io
+    image = io.BytesIO()
+    storage.Image.new("RGB", (1000, 500), "red").save(image, "PNG")
+    test_client.put("/book/1/cover", content=image.getvalue(), headers=admin("image/png"))
+
+    response = test_client.get("/book/1/cover/thumbnail?size=128")
+    response_cached = test_client.get("/book/1/cover/thumbnail?size=128")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert storage.Image.open(io.BytesIO(response.content)).size == (128, 64)
+    assert response_cached.content == response.content
+
+
+@pytest.mark.skipif(storage.Image is None, reason="needs Pillow")
+def test_cover_not_an_image(test_client):
+    response = test_client.put("/book/1/cover", content=b"<html>", headers=admin("image/png"))
+
+    assert response.status_code == 415
+    assert test_client.get("/book/1/files").json() == []
+
+
+@pytest.mark.skipif(storage.Image is None, reason="needs Pillow")
+def test_cover_thumbnail_of_stored_non_image(test_client, monkeypatch):
+    image = storage.Image
+    # taken by its Content-Type while Pillow was not installed
+    monkeypatch.setattr(storage, "Image", None)
+    test_client.put("/book/1/cover", content=b"<html>", headers=admin("image/png"))
+    monkeypatch.setattr(storage, "Image", image)
+    with TestingSessionLocal() as db:
+        assert db.query(BookFile).count() == 1
+
+    response = test_client.get("/book/1/cover/thumbnail?size=128")
+
+    assert response.status_code == 422
@@ -0,0 +1,40 @@
+from sqlalchemy import PrimaryKeyConstraint, UniqueConstraint
+
+from app.models import Base
+
+
+def leading_columns(table) -> set[str]:
+    """Columns an index, primary key or unique constraint of the table can look rows up by."""
+    leading = set()
+    for index in table.indexes:
+        leading.add(index.columns[0].name)
+    for constraint in table.constraints:
+        if isinstance(constraint, (PrimaryKeyConstraint, UniqueConstraint)) and constraint.columns:
+            leading.add(list(constraint.columns)[0].name)
+    return leading
+
+
+def test_foreign_keys_are_indexed():
+    # joins, filters and the checks of deletes in the referenced table all look rows up by the foreign key
+    missing = [f"{table.name}.{fk.parent.name}"
+               for table in Base.metadata.sorted_tables
+               for fk in table.foreign_keys
+               if fk.parent.name not in leading_columns(table)]
+
+    assert missing == []
+
+
+def test_no_dead_indexes():
+    dead = []
+    for table in Base.metadata.sorted_tables:
+        primary_key = [column.name for column in table.primary_key.columns]
+        for index in table.indexes:
+            columns = [column.name for column in index.columns]
+            # the primary key has an index of its own
+            if columns == primary_key:
+                dead.append(index.name)
+    password_indexes = [index.name for index in Base.metadata.tables["users"].indexes
+                        if "password" in index.columns]
+
+    assert dead == []
+    assert password_indexes == []
@@ -1,7 +1,7 @@
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from datetime import date
 
@@ -9,7 +9,8 @@ from app.book.books import router as book_router
 from app.author.authors import router as author_router
 from app.user.auth import router as auth_router
 from app.book.loan_books import router as loans_router, get_db
-from app.models import Base
+from app.book.archive import router as archive_router
+from app.models import Base, Loan, get_read_db
 from app.user.jwt import *
 
 DATABASE_URL = "sqlite:///./test.db"
@@ -17,6 +18,13 @@ SECRET_KEY = "HASAN2008"
 ALGORITHM = "HS256"
 
 engine = create_engine(DATABASE_URL)
+
+
+@event.listens_for(engine, "connect")
+def enable_foreign_keys(connection, record):
+    connection.execute("PRAGMA foreign_keys=ON")
+
+
 Base.metadata.create_all(bind=engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -25,6 +33,7 @@ app.include_router(book_router)
 app.include_router(author_router)
 app.include_router(auth_router)
 app.include_router(loans_router)
+app.include_router(archive_router)
 
 
 def override_get_db():
@@ -36,6 +45,7 @@ def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 def create_jwt_token(role: str, u_id: Optional[int] = 1):
@@ -164,3 +174,244 @@ def test_return_book(test_client, create_depends):
     assert response_non_exists_book.json()["detail"] == "Not found loans by user or book"
     assert response_non_exists_book_by_user.status_code == 404
     assert response_non_exists_book_by_user.json()["detail"] == "Not found loans by user or book"
+
+
+def test_reservation_hand_off(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    user1 = create_jwt_token(u_id=1, role="reader")
+    user2 = create_jwt_token(u_id=2, role="reader")
+    user3 = create_jwt_token(u_id=3, role="reader")
+    test_client.put(
+        "/book/update/1",
+        json={"title": "Test book", "description": "Test description book", "publication": "1000-01-01",
+              "authors": [1], "style": "bok", "copies": 1},
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_reserve = test_client.post(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user2}"}
+    )
+    response_reserve_twice = test_client.post(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user2}"}
+    )
+    response_reserve_second = test_client.post(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user3}"}
+    )
+    response_reserve_available = test_client.post(
+        "/book/reserve/2",
+        headers={"Authorization": f"Bearer {user2}"}
+    )
+    response_return = test_client.delete(
+        "/book/return/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_take_after_return = test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_return_handed_off = test_client.delete(
+        "/book/return/1",
+        headers={"Authorization": f"Bearer {user2}"}
+    )
+    response_cancel = test_client.delete(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user3}"}
+    )
+
+    assert response_reserve.status_code == 201, response_reserve.json()
+    assert response_reserve.json()["position"] == 1
+    assert response_reserve_twice.status_code == 409
+    assert response_reserve_second.json()["position"] == 2
+    assert response_reserve_available.status_code == 409
+    assert response_return.status_code == 200
+    # the returned copy went straight to user 2, nothing is left on the shelf
+    assert response_take_after_return.status_code == 403
+    assert response_take_after_return.json()["detail"] == "Not enough copies of books."
+    assert response_return_handed_off.status_code == 200
+    # user 3 got the copy returned by user 2, so the reservation is gone
+    assert response_cancel.status_code == 404
+
+
+def test_take_book_idempotency_key(test_client, create_depends):
+    user1 = create_jwt_token(u_id=1, role="reader")
+    user2 = create_jwt_token(u_id=2, role="reader")
+    headers = {"Authorization": f"Bearer {user1}", "Idempotency-Key": "retry-1"}
+
+    response_first = test_client.post("/book/take/1", headers=headers)
+    response_retry = test_client.post("/book/take/1", headers=headers)
+    response_other_user = test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user2}", "Idempotency-Key": "retry-1"}
+    )
+    response_book = test_client.get("/book/get/1")
+
+    assert response_first.status_code == 200, response_first.json()
+    assert response_retry.status_code == 200
+    assert response_retry.json() == response_first.json()
+    assert response_retry.headers["Idempotent-Replayed"] == "true"
+    assert response_other_user.json()["id"] != response_first.json()["id"]
+    # only two loans were made
+    assert response_book.json()["copies"] == 4
+
+
+def test_returned_loans_are_archived(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    user1 = create_jwt_token(u_id=1, role="reader")
+    response_take = test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    test_client.delete(
+        "/book/return/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_take_again = test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_history = test_client.get(
+        f"/admin/loans/history?start={date.today()}&end=2999-01-01&user_id=1",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_history_non_admin = test_client.get(
+        f"/admin/loans/history?start={date.today()}&end=2999-01-01",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+
+    assert response_history.status_code == 200, response_history.json()
+    assert len(response_history.json()) == 1
+    assert response_history.json()[0]["id"] == response_take.json()["id"]
+    assert response_history.json()[0]["returned_at"] == str(date.today())
+    assert response_take_again.json()["id"] != response_take.json()["id"]
+    assert response_history_non_admin.status_code == 403
+
+
+def test_replayed_checkout_is_not_rate_limited(test_client, create_depends, monkeypatch):
+    from app import ratelimit
+    from app.book.loan_books import checkout_limit
+
+    ratelimit.backend.reset()
+    monkeypatch.setattr(checkout_limit, "capacity", 1)
+    monkeypatch.setattr(checkout_limit, "rate", 1 / 60)
+    user1 = create_jwt_token(u_id=1, role="reader")
+    headers = {"Authorization": f"Bearer {user1}", "Idempotency-Key": "retry-1"}
+
+    response_first = test_client.post("/book/take/1", headers=headers)
+    response_retry = test_client.post("/book/take/1", headers=headers)
+    response_new = test_client.post("/book/take/2", headers={"Authorization": f"Bearer {user1}"})
+    ratelimit.backend.reset()
+
+    assert response_first.status_code == 200, response_first.json()
+    assert response_retry.status_code == 200
+    assert response_retry.headers["Idempotent-Replayed"] == "true"
+    assert response_new.status_code == 429
+
+
+def test_delete_reserved_book(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    user1 = create_jwt_token(u_id=1, role="reader")
+    test_client.put(
+        "/book/update/1",
+        json={"title": "Test book", "description": "Test description book", "publication": "1000-01-01",
+              "authors": [1], "style": "bok", "copies": 0},
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    test_client.post(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+
+    response_delete = test_client.delete(
+        "/book/delete/1",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_cancel = test_client.delete(
+        "/book/reserve/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+
+    assert response_delete.status_code == 200, response_delete.json()
+    assert response_cancel.status_code == 404
+
+
+def test_delete_book_on_loan(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    user1 = create_jwt_token(u_id=1, role="reader")
+    for book_id in (1, 2, 3):
+        test_client.post(
+            f"/book/take/{book_id}",
+            headers={"Authorization": f"Bearer {user1}"}
+        )
+
+    response_refused = test_client.delete(
+        "/book/delete/1",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_soft = test_client.delete(
+        "/book/delete/1?loans=soft_delete",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_get_soft = test_client.get("/book/get/1")
+    response_return_soft = test_client.delete(
+        "/book/return/1",
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_bulk = test_client.post(
+        "/admin/books/delete",
+        json={"ids": [1, 2, 100], "loans": "archive"},
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_bulk_non_admin = test_client.post(
+        "/admin/books/delete",
+        json={"ids": [3]},
+        headers={"Authorization": f"Bearer {user1}"}
+    )
+    response_history = test_client.get(
+        f"/admin/loans/history?start={date.today()}&end=2999-01-01&user_id=1",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_books = test_client.get("/book/get")
+
+    assert response_refused.status_code == 409
+    assert response_soft.status_code == 200, response_soft.json()
+    assert response_get_soft.status_code == 404
+    assert response_return_soft.status_code == 200
+    assert response_bulk.json() == {"deleted": [1, 2], "soft_deleted": [], "not_found": [100]}
+    assert response_bulk_non_admin.status_code == 403
+    # the returned loan of book 1 and the loan of book 2 ended by the delete
+    assert sorted(loan["book_id"] for loan in response_history.json()) == [1, 2]
+    assert [book["id"] for book in response_books.json()] == [3]
+
+
+def test_my_loans(test_client, create_depends):
+    user1 = create_jwt_token(u_id=1, role="reader")
+    user2 = create_jwt_token(u_id=2, role="reader")
+    for book_id in (1, 2, 3):
+        test_client.post(f"/book/take/{book_id}", headers={"Authorization": f"Bearer {user1}"})
+    test_client.post("/book/take/1", headers={"Authorization": f"Bearer {user2}"})
+    with TestingSessionLocal() as db:
+        # book 3 is due first, book 1 is overdue
+        db.query(Loan).filter(Loan.user_id == 1, Loan.book_id == 3).update({"return_date": date(2000, 1, 1)})
+        db.commit()
+
+    first_page = test_client.get("/me/loans?limit=2", headers={"Authorization": f"Bearer {user1}"}).json()
+    second_page = test_client.get(
+        f"/me/loans?limit=2&cursor={first_page['next_cursor']}",
+        headers={"Authorization": f"Bearer {user1}"}
+    ).json()
+    response_bad_cursor = test_client.get("/me/loans?cursor=broken", headers={"Authorization": f"Bearer {user1}"})
+    response_anonymous = test_client.get("/me/loans")
+
+    assert [loan["book_id"] for loan in first_page["items"]] == [3, 1]
+    assert first_page["items"][0]["overdue"] is True
+    assert first_page["items"][0]["title"] == "Test book"
+    assert [loan["book_id"] for loan in second_page["items"]] == [2]
+    assert second_page["next_cursor"] is None
+    assert response_bad_cursor.status_code == 400
+    assert response_anonymous.status_code == 401
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from app.main import create_app
+
+
+def test_create_app_registers_routes():
+    app = create_app()
+    paths = set(app.openapi()["paths"])
+
+    assert {"/login", "/book/get", "/author/get", "/book/take/{book_id}", "/admin/stats"} <= paths
+
+
+def test_lifespan_starts_and_stops_worker():
+    from app import events
+
+    with TestClient(create_app()):
+        assert events.worker.running
+    assert not events.worker.running
+
+
+def test_lifespan_reports_startup():
+    app = create_app()
+    with TestClient(app):
+        report = app.state.startup_report
+
+    assert {"imports", "db_pool", "crypto", "schemas", "startup"} <= set(report)
+    assert app.openapi_schema is not None
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import ratelimit
+from app.ratelimit import MemoryBackend, RateLimit
+
+app = FastAPI()
+limit = RateLimit("test", "3/60")
+
+
+@app.get("/limited", dependencies=[Depends(limit)])
+def limited():
+    return {"detail": "ok"}
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def reset_limits():
+    ratelimit.backend.reset()
+
+
+def test_rate_limit_returns_429(test_client):
+    responses = [test_client.get("/limited") for _ in range(4)]
+
+    assert [response.status_code for response in responses] == [200, 200, 200, 429]
+    assert responses[-1].json() == {"detail": "Too many requests"}
+    assert int(responses[-1].headers["Retry-After"]) == 20
+
+
+def test_bucket_refills():
+    backend = MemoryBackend(shards=2)
+    assert backend.hit("key", rate=100, capacity=1) == 0
+    assert backend.hit("key", rate=100, capacity=1) > 0
+    time.sleep(0.02)
+    assert backend.hit("key", rate=100, capacity=1) == 0
+
+
+def test_full_buckets_are_swept():
+    backend = MemoryBackend(shards=1, sweep_every=5)
+    for i in range(4):
+        backend.hit(f"key{i}", rate=1000, capacity=1)
+    time.sleep(0.01)
+    backend.hit("last", rate=1000, capacity=1)
+
+    assert len(backend) == 1
@@ -0,0 +1,176 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import events
+from app.book import related
+from app.book.books import router as book_router
+from app.author.authors import router as author_router
+from app.user.auth import router as auth_router
+from app.book.loan_books import router as loans_router, get_db
+from app.models import Base, BookPair, get_read_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+
+
+@event.listens_for(engine, "connect")
+def enable_foreign_keys(connection, record):
+    connection.execute("PRAGMA foreign_keys=ON")
+
+
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(book_router)
+app.include_router(author_router)
+app.include_router(auth_router)
+app.include_router(loans_router)
+app.include_router(related.router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+
+def create_jwt_token(role: str, u_id: Optional[int] = 1):
+    token = create_access_token(data={"id": u_id, "username": "TestUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown(monkeypatch):
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(related, "SessionLocal", TestingSessionLocal)
+
+
+@pytest.fixture(scope="function")
+def create_depends(test_client):
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/author/create",
+        json={"name": "Test Author", "bio": "This is a test bio.", "bday": "1000-01-01"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    for i in range(4):
+        test_client.post(
+            "/book/create",
+            json={"title": f"Test book {i + 1}", "description": "Test description book",
+                  "publication": "1000-01-01", "authors": [1], "style": "bok", "copies": 5},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    for i in range(3):
+        test_client.post(
+            "/register",
+            json={"username": "TestUser", "email": f"test{i}@test.ru", "password": "test"}
+        )
+    yield
+
+
+def take_books(test_client, loans):
+    for user_id, book_id in loans:
+        test_client.post(
+            f"/book/take/{book_id}",
+            headers={"Authorization": f"Bearer {create_jwt_token(u_id=user_id, role='reader')}"}
+        )
+    # deliver the loan.taken events like the background worker does
+    events.EventWorker(TestingSessionLocal).poll()
+
+
+def test_related_books(test_client, create_depends):
+    take_books(test_client, [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 1), (3, 4), (3, 2)])
+
+    response = test_client.get("/book/1/related")
+    response_limit = test_client.get("/book/1/related?limit=1")
+    response_non_exists = test_client.get("/book/100/related")
+
+    assert response.status_code == 200, response.json()
+    assert [(book["id"], book["count"]) for book in response.json()] == [(2, 3), (3, 1), (4, 1)]
+    assert response.json()[0]["title"] == "Test book 2"
+    assert [book["id"] for book in response_limit.json()] == [2]
+    assert response_non_exists.status_code == 404
+
+
+def test_compact_keeps_top_k(test_client, create_depends):
+    take_books(test_client, [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 1), (3, 4)])
+
+    with TestingSessionLocal() as db:
+        removed = related.compact(db, top_k=1)
+        pairs = db.query(BookPair.book_id, BookPair.related_id).order_by(BookPair.book_id).all()
+
+    assert removed == 4
+    assert [tuple(pair) for pair in pairs] == [(1, 2), (2, 1), (3, 1), (4, 1)]
+
+
+def test_repeat_loan_counted_once(test_client, create_depends):
+    reader = {"Authorization": f"Bearer {create_jwt_token(u_id=1, role='reader')}"}
+    take_books(test_client, [(1, 1), (1, 2)])
+    test_client.delete("/book/return/2", headers=reader)
+    # borrowed again, and a second copy of the book the reader holds
+    take_books(test_client, [(1, 2), (1, 1)])
+
+    response = test_client.get("/book/1/related")
+
+    assert [(book["id"], book["count"]) for book in response.json()] == [(2, 1)]
+
+
+def test_redelivered_event_counted_once(test_client, create_depends):
+    calls = []
+
+    def flaky(db, topic, payload):
+        calls.append(topic)
+        if len(calls) == 2:
+            raise RuntimeError("handler failed")
+
+    events.handlers["*"].append(flaky)
+    try:
+        # the second loan.taken fails after count_co_borrowing ran and is delivered again
+        take_books(test_client, [(1, 1), (1, 2)])
+        events.EventWorker(TestingSessionLocal).poll()
+    finally:
+        events.handlers["*"].remove(flaky)
+
+    response = test_client.get("/book/1/related")
+
+    assert len(calls) == 3
+    assert [(book["id"], book["count"]) for book in response.json()] == [(2, 1)]
+
+
+def test_delete_related_book(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    take_books(test_client, [(1, 1), (1, 2), (1, 3)])
+    for book_id in (1, 2):
+        test_client.delete(
+            f"/book/return/{book_id}",
+            headers={"Authorization": f"Bearer {create_jwt_token(u_id=1, role='reader')}"}
+        )
+
+    response_delete = test_client.delete(
+        "/book/delete/2",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response = test_client.get("/book/1/related")
+
+    assert response_delete.status_code == 200, response_delete.json()
+    assert [book["id"] for book in response.json()] == [3]
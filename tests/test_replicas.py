@@ -0,0 +1,38 @@
+from sqlalchemy import text
+
+from app.models import ReplicaPool
+
+REPLICA_URL = "sqlite:///./test.db"
+BROKEN_REPLICA_URL = "sqlite:////non/existent/dir/replica.db"
+
+
+def test_replicas_round_robin():
+    pool = ReplicaPool([REPLICA_URL, REPLICA_URL])
+    used = []
+    for _ in range(4):
+        db = pool.session()
+        used.append(db.get_bind())
+        db.close()
+
+    assert used[0] is used[2]
+    assert used[1] is used[3]
+    assert used[0] is not used[1]
+    pool.dispose()
+
+
+def test_replicas_skip_unhealthy():
+    pool = ReplicaPool([BROKEN_REPLICA_URL, REPLICA_URL])
+    for _ in range(3):
+        db = pool.session()
+        assert db.execute(text("SELECT 1")).scalar() == 1
+        db.close()
+
+    assert pool.check_health() == [False, True]
+    pool.dispose()
+
+
+def test_replicas_all_down():
+    pool = ReplicaPool([BROKEN_REPLICA_URL])
+
+    assert pool.session() is None
+    pool.dispose()
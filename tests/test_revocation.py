@@ -0,0 +1,141 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import revocation
+from app.revocation import BloomFilter, Denylist
+from app.user.admin import router as admin_router
+from app.user.auth import router as auth_router
+from app.models import Base, RevokedToken, User, get_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(auth_router)
+app.include_router(admin_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def create_jwt_token(user_id: int, role: str):
+    token = create_access_token(data={"id": user_id, "username": "testUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    revocation.denylist.clear()
+    yield
+    revocation.denylist.clear()
+
+
+def test_logout_revokes_only_that_token(test_client):
+    token = create_jwt_token(1, "admin")
+    other_token = create_jwt_token(1, "admin")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = test_client.post("/logout", headers=headers)
+    response_after = test_client.get("/admin/dashboard", headers=headers)
+    response_other = test_client.get("/admin/dashboard", headers={"Authorization": f"Bearer {other_token}"})
+
+    assert response.status_code == 200
+    assert response_after.status_code == 401
+    assert response_other.status_code == 200
+    with TestingSessionLocal() as db:
+        assert db.query(RevokedToken).count() == 1
+
+
+def test_revoke_user_tokens(test_client):
+    with TestingSessionLocal() as db:
+        db.add(User(id=2, username="Reader", email="reader@test.ru", password="x"))
+        db.commit()
+    admin_headers = {"Authorization": f"Bearer {create_jwt_token(1, 'admin')}"}
+    old_token = create_jwt_token(2, "admin")
+
+    response = test_client.post("/admin/users/2/revoke_tokens", headers=admin_headers)
+    response_old = test_client.get("/admin/dashboard", headers={"Authorization": f"Bearer {old_token}"})
+    new_token = create_jwt_token(2, "admin")
+    response_new = test_client.get("/admin/dashboard", headers={"Authorization": f"Bearer {new_token}"})
+
+    assert response.status_code == 200
+    assert response_old.status_code == 401
+    assert response_new.status_code == 200
+    assert test_client.post("/admin/users/3/revoke_tokens", headers=admin_headers).status_code == 404
+
+
+def test_demoted_user_token_revoked(test_client):
+    with TestingSessionLocal() as db:
+        db.add(User(id=2, username="Admin2", email="admin2@test.ru", password="x", role="admin"))
+        db.commit()
+    admin_headers = {"Authorization": f"Bearer {create_jwt_token(1, 'admin')}"}
+    demoted_token = create_jwt_token(2, "admin")
+
+    test_client.put(
+        "/admin/update_user/2",
+        json={"username": "Admin2", "email": "admin2@test.ru", "password": "x", "role": "reader"},
+        headers=admin_headers
+    )
+    response = test_client.get("/admin/dashboard", headers={"Authorization": f"Bearer {demoted_token}"})
+
+    assert response.status_code == 401
+
+
+def test_denylist_refreshes_from_database(test_client):
+    token = create_jwt_token(1, "admin")
+    test_client.post("/logout", headers={"Authorization": f"Bearer {token}"})
+    payload = decode_token(token)
+    other_process = Denylist(capacity=4)
+
+    with TestingSessionLocal() as db:
+        assert other_process.refresh(db) == 1
+        # incremental, nothing new since the last refresh besides the overlap
+        assert other_process.refresh(db) == 1
+
+    assert other_process.is_revoked(payload["jti"], 1, payload["iat"])
+    assert not other_process.is_revoked("another", 1, payload["iat"])
+
+
+def test_denylist_grows_past_capacity():
+    denylist = Denylist(capacity=4)
+    expires_at = datetime(2100, 1, 1)
+    for i in range(20):
+        denylist.add(f"jti{i}", expires_at)
+
+    assert len(denylist) == 20
+    assert all(denylist.is_revoked(f"jti{i}", None, None) for i in range(20))
+    assert not denylist.is_revoked("jti20", None, None)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"member{i}")
+
+    assert all(f"member{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
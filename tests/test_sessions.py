@@ -0,0 +1,116 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import ratelimit, revocation
+from app.user.admin import router as admin_router
+from app.user.auth import router as auth_router
+from app.models import Base, User, UserSession, get_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(auth_router)
+app.include_router(admin_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ratelimit.backend.reset()
+    revocation.denylist.clear()
+    with TestingSessionLocal() as db:
+        db.add(User(id=1, username="Reader", email="reader@test.ru", password=get_password_hash("test")))
+        db.commit()
+    yield
+    revocation.denylist.clear()
+
+
+def login(test_client):
+    return test_client.post("/login", json={"email": "reader@test.ru", "password": "test"}).json()
+
+
+def test_refresh_rotates_token(test_client):
+    tokens = login(test_client)
+
+    response = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    refreshed = response.json()
+
+    assert response.status_code == 200
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    assert decode_token(refreshed["access_token"])["sid"] == decode_token(tokens["access_token"])["sid"]
+    with TestingSessionLocal() as db:
+        user_session = db.query(UserSession).one()
+        # only the hash is stored
+        assert tokens["refresh_token"] not in (user_session.token_hash, user_session.previous_hash)
+
+
+def test_reused_refresh_token_ends_session(test_client):
+    tokens = login(test_client)
+    refreshed = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    response_reused = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    response_current = test_client.post("/token/refresh", json={"refresh_token": refreshed["refresh_token"]})
+
+    assert response_reused.status_code == 401
+    assert response_current.status_code == 401
+    assert test_client.post("/token/refresh", json={"refresh_token": "unknown"}).status_code == 401
+
+
+def test_refresh_reads_current_role(test_client):
+    tokens = login(test_client)
+    with TestingSessionLocal() as db:
+        db.get(User, 1).role = "admin"
+        db.commit()
+
+    refreshed = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    assert decode_token(tokens["access_token"])["role"] == "reader"
+    assert decode_token(refreshed["access_token"])["role"] == "admin"
+
+
+def test_logout_ends_session(test_client):
+    tokens = login(test_client)
+
+    test_client.post("/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    response = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 401
+
+
+def test_admin_revoke_ends_sessions(test_client):
+    tokens = login(test_client)
+    admin_token = create_access_token(data={"id": 2, "username": "Admin", "role": "admin"})
+
+    test_client.post("/admin/users/1/revoke_tokens", headers={"Authorization": f"Bearer {admin_token}"})
+    response = test_client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 401
+    with TestingSessionLocal() as db:
+        assert db.query(UserSession).count() == 0
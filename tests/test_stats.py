@@ -0,0 +1,157 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from datetime import date
+
+from app.book.books import router as book_router
+from app.author.authors import router as author_router
+from app.user.auth import router as auth_router
+from app.book.loan_books import router as loans_router
+from app.stats.stats import router as stats_router, get_db
+from app.models import Base
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(book_router)
+app.include_router(author_router)
+app.include_router(auth_router)
+app.include_router(loans_router)
+app.include_router(stats_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def create_jwt_token(role: str, u_id: Optional[int] = 1):
+    token = create_access_token(data={"id": u_id, "username": "TestUser", "role": role})
+    return token
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def create_depends(test_client):
+    token = create_jwt_token(role="admin")
+    test_client.post(
+        "/author/create",
+        json={"name": "Test Author", "bio": "This is a test bio.", "bday": "1000-01-01"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    for style in ["novel", "novel", "poem"]:
+        test_client.post(
+            "/book/create",
+            json={"title": f"Test {style}", "description": "Test description book", "publication": "1000-01-01",
+                  "authors": [1], "style": style, "copies": 5},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    for i in range(2):
+        test_client.post(
+            "/register",
+            json={"username": "TestUser", "email": f"test{i}@test.ru", "password": "test"}
+        )
+    yield
+
+
+def test_stats_follow_loans(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    user1 = create_jwt_token(u_id=1, role="reader")
+    user2 = create_jwt_token(u_id=2, role="reader")
+    for user, book_id in [(user1, 1), (user1, 2), (user2, 2)]:
+        test_client.post(
+            f"/book/take/{book_id}",
+            headers={"Authorization": f"Bearer {user}"}
+        )
+    test_client.delete(
+        "/book/return/2",
+        headers={"Authorization": f"Bearer {user2}"}
+    )
+    test_client.delete(
+        "/book/delete/3",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+
+    response = test_client.get(
+        "/admin/stats",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["books_per_style"] == {"novel": 2}
+    assert response.json()["loans_per_month"] == {date.today().strftime("%Y-%m"): 3}
+    assert response.json()["top_borrowed"][0] == {"book_id": 2, "title": "Test novel", "loans": 2}
+    assert response.json()["active_readers"] == 1
+
+    response_rebuilt = test_client.post(
+        "/admin/stats/rebuild",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    # returned loans are counted from the archive
+    assert response_rebuilt.json() == response.json()
+
+
+def test_rebuild_stats(test_client, create_depends):
+    admin = create_jwt_token(role="admin")
+    reader = create_jwt_token(u_id=1, role="reader")
+    test_client.post(
+        "/book/take/1",
+        headers={"Authorization": f"Bearer {reader}"}
+    )
+    before = test_client.get(
+        "/admin/stats",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response = test_client.post(
+        "/admin/stats/rebuild",
+        headers={"Authorization": f"Bearer {admin}"}
+    )
+    response_non_admin = test_client.get(
+        "/admin/stats",
+        headers={"Authorization": f"Bearer {reader}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == before.json()
+    assert response_non_admin.status_code == 403
+
+
+def test_bump_counter_created_by_another_session():
+    from app.models import MonthlyLoanStats
+    from app.stats.stats import bump
+
+    with TestingSessionLocal() as db, TestingSessionLocal() as other:
+        # both see no row for the month yet
+        assert db.query(MonthlyLoanStats).count() == 0
+        bump(other, MonthlyLoanStats, MonthlyLoanStats.loans, 1, month="2024-01")
+        other.commit()
+        bump(db, MonthlyLoanStats, MonthlyLoanStats.loans, 1, month="2024-01")
+        bump(db, MonthlyLoanStats, MonthlyLoanStats.loans, 1, month="2024-01")
+        db.commit()
+
+        assert db.query(MonthlyLoanStats.loans).filter(MonthlyLoanStats.month == "2024-01").scalar() == 3
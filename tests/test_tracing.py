@@ -0,0 +1,118 @@
+import io
+import json
+import logging
+from datetime import date
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import tracing
+from app.models import Author, Base, Book
+from app.user.auth import get_current_user
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI(dependencies=[Depends(tracing.trace_handler, scope="function")])
+app.add_middleware(tracing.TracingMiddleware, sample_rate=1.0)
+
+
+def get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@app.get("/traced/{book_id}", response_model=dict)
+def traced(book_id: int, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+    book = db.get(Book, book_id)
+    logging.getLogger("test.tracing").info("loaded the book")
+    return {"title": book.title, "authors": [author.name for author in book.authors]}
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown(monkeypatch):
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with TestingSessionLocal() as db:
+        db.add(Book(title="Test book", description="", publication=date(1000, 1, 1), style="bok", copies=1,
+                    authors=[Author(name="Test Author", bio="", bday=date(1000, 1, 1))]))
+        db.commit()
+    stream = io.StringIO()
+    monkeypatch.setattr(tracing, "exporter", tracing.StreamExporter(stream))
+    yield stream
+
+
+def exported(stream) -> list[dict]:
+    return [span for line in stream.getvalue().splitlines()
+            for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+
+
+def test_request_spans(test_client, setup_and_teardown, caplog):
+    tracing.install_log_ids()
+    token = create_access_token(data={"id": 1, "username": "TestUser", "role": "reader"})
+
+    with caplog.at_level(logging.INFO, logger="test.tracing"):
+        response = test_client.get("/traced/1", headers={"Authorization": f"Bearer {token}"})
+
+    spans = {span["name"]: span for span in exported(setup_and_teardown)}
+    root = spans["GET /traced/1"]
+    assert response.status_code == 200
+    assert {"handler", "auth.decode_token", "db.query", "orm.relationship_load", "serialize"} <= set(spans)
+    assert len({span["traceId"] for span in spans.values()}) == 1
+    assert spans["handler"]["parentSpanId"] == root["spanId"]
+    assert spans["serialize"]["parentSpanId"] == root["spanId"]
+    assert spans["auth.decode_token"]["parentSpanId"] == spans["handler"]["spanId"]
+    assert {"key": "http.response.status_code", "value": {"intValue": "200"}} in root["attributes"]
+    assert response.headers["traceparent"] == f"00-{root['traceId']}-{root['spanId']}-01"
+    assert caplog.records[0].trace_id == root["traceId"]
+
+
+def test_incoming_traceparent_continues_trace(test_client, setup_and_teardown, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_TRUST_PARENT", True)
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    token = create_access_token(data={"id": 1, "username": "TestUser", "role": "reader"})
+
+    response = test_client.get("/traced/1", headers={"Authorization": f"Bearer {token}",
+                                                    "traceparent": f"00-{trace_id}-{parent_id}-01"})
+    response_not_sampled = test_client.get("/traced/1", headers={"Authorization": f"Bearer {token}",
+                                                                 "traceparent": f"00-{trace_id}-{parent_id}-00"})
+
+    spans = exported(setup_and_teardown)
+    root = next(span for span in spans if span["kind"] == 2)
+    assert {span["traceId"] for span in spans} == {trace_id}
+    assert root["parentSpanId"] == parent_id
+    assert response.headers["traceparent"].startswith(f"00-{trace_id}-")
+    # the caller did not sample it, only the ids are passed on
+    assert response_not_sampled.headers["traceparent"].endswith("-00")
+    assert len([span for span in spans if span["kind"] == 2]) == 1
+
+
+def test_untrusted_traceparent_sampled_locally():
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+    with tracing.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-01", sample_rate=0.0) as root:
+        pass
+    with tracing.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-00", sample_rate=1.0) as root_local:
+        pass
+
+    # the caller cannot have its requests recorded, the ids are kept
+    assert not root.trace.sampled
+    assert (root.trace.trace_id, root.parent_id) == (trace_id, parent_id)
+    assert root_local.trace.sampled
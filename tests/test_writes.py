@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import ratelimit
+from app.author.authors import router as author_router
+from app.book.books import router as book_router
+from app.book.loan_books import router as loan_router
+from app.user.admin import router as admin_router
+from app.user.auth import router as auth_router
+from app.models import Author, Base, Book, User, get_db
+from app.user.jwt import *
+
+DATABASE_URL = "sqlite:///./test.db"
+
+engine = create_engine(DATABASE_URL)
+Base.metadata.create_all(bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+app = FastAPI()
+app.include_router(author_router)
+app.include_router(book_router)
+app.include_router(loan_router)
+app.include_router(admin_router)
+app.include_router(auth_router)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+
+def create_jwt_token(role: str):
+    token = create_access_token(data={"id": 1, "username": "testUser", "role": role})
+    return token
+
+
+@contextmanager
+def statements():
+    """First keyword of every statement sent to the database, COMMIT for the commits."""
+    sent = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement.split()[0].upper())
+
+    def commit(conn):
+        sent.append("COMMIT")
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "commit", commit)
+    try:
+        yield sent
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(engine, "commit", commit)
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    yield client
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_and_teardown():
+    # Очистка базы данных перед каждым тестом
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ratelimit.backend.reset()
+    with TestingSessionLocal() as db:
+        db.add(User(id=1, username="testUser", email="test@test.ru", password="x"))
+        db.add(Author(id=1, name="Author", bio="Bio", bday=date(1900, 1, 1)))
+        db.commit()
+
+
+def test_create_author_round_trips(test_client):
+    with statements() as sent:
+        response = test_client.post(
+            "/author/create",
+            json={"name": "New", "bio": "Bio", "bday": "1950-01-01"},
+            headers={"Authorization": f"Bearer {create_jwt_token('admin')}"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == 2
+    assert sent == ["INSERT", "COMMIT"]
+
+
+def test_register_user_round_trips(test_client):
+    with statements() as sent:
+        response = test_client.post(
+            "/register",
+            json={"username": "Reader", "email": "reader@test.ru", "password": "test"}
+        )
+    response_taken = test_client.post(
+        "/register",
+        json={"username": "Other", "email": "reader@test.ru", "password": "test"}
+    )
+
+    assert response.status_code == 201
+    assert response.json()["role"] == "reader"
+    assert sent == ["INSERT", "COMMIT"]
+    assert response_taken.status_code == 400
+    assert response_taken.json() == {"detail": "Email already registered"}
+
+
+def test_register_new_user_round_trips(test_client):
+    with statements() as sent:
+        response = test_client.post(
+            "/admin/register_new",
+            json={"username": "Reader", "email": "reader@test.ru", "password": "test"},
+            headers={"Authorization": f"Bearer {create_jwt_token('admin')}"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["role"] == "reader"
+    # the user and its outbox event
+    assert sent == ["INSERT", "INSERT", "COMMIT"]
+
+
+def test_create_book_round_trips(test_client):
+    with statements() as sent:
+        response = test_client.post(
+            "/book/create",
+            json={"title": "Book", "description": "Text", "publication": "2000-01-01", "authors": [1],
+                  "style": "Novel", "copies": 2},
+            headers={"Authorization": f"Bearer {create_jwt_token('admin')}"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["authors"][0]["name"] == "Author"
+    assert response.json()["loans"] == []
+    # the authors check, the book, its author links and the style counter, nothing is read back
+    assert sent == ["SELECT", "INSERT", "INSERT", "INSERT", "COMMIT"]
+
+
+def test_take_book_round_trips(test_client):
+    with TestingSessionLocal() as db:
+        db.add(Book(id=1, title="Book", description="Text", publication=date(2000, 1, 1), style="Novel", copies=1))
+        db.commit()
+    headers = {"Authorization": f"Bearer {create_jwt_token('reader')}"}
+
+    with statements() as sent:
+        response = test_client.post("/book/take/1", headers=headers)
+    response_no_copies = test_client.post("/book/take/1", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["book"]["copies"] == 0
+    assert response.json()["user"]["email"] == "test@test.ru"
+    # the copy is checked and taken by one UPDATE ... RETURNING, no SELECT of the book before it
+    assert sent[:2] == ["SELECT", "UPDATE"]
+    assert sent[-1] == "COMMIT"
+    assert sent.count("COMMIT") == 1
+    assert response_no_copies.status_code == 403
+    assert response_no_copies.json() == {"detail": "Not enough copies of books."}